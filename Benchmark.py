@@ -0,0 +1,314 @@
+"""Benchmarks of the solver on the ingredients of Potionomics.xlsx, every ingredient unlocked.
+
+python Benchmark.py [name ...] runs the named benchmarks, all of them by default, and prints one line per case.
+
+python Benchmark.py suite [options] runs the solver on synthetic ingredient tables instead, over a grid of
+ingredient counts, slot counts, potions, traits and the daily limit, each case --repeat times in a process of its
+own and for at most --budget seconds. The large cases are stopped at the budget, their speed being that of the
+combinations scored by then. The wall time, combinations per second and peak memory of the run of median speed
+of every case are written to --output as json, and compared to an earlier output given as --baseline, such as
+benchmarks/baseline.json. Qt is never imported.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+import Solver
+
+EXCEL_LOC = './Potionomics.xlsx'
+
+
+def prepare(ingredients, potion, traits=(), dailyLimit=False):
+    # The arrays solve gives the search functions
+    query = Solver.Query(potion, 0, 0, dailyLimit, traits, np.ones(len(ingredients.names), dtype=bool))
+    _, values, magiminRatio, stock, cover, required = Solver.queryArrays(ingredients, query)
+    return values, magiminRatio, stock, cover, required
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def filteredAfter(n, k, stock, cover, required):
+    # Trait coverage checked on finished combinations, as before it was tracked during the enumeration
+    for chunk in Solver.iterCombinationChunks(n, k, Solver.CHUNK_SIZE, stock):
+        chunk = chunk[Solver.coversTraits(chunk, cover, required)]
+        if chunk.shape[0] > 0:
+            yield chunk
+
+
+def benchmarkTraits(ingredients):
+    # All five traits selected
+    cases = [('Mana Potion', 8, 400), ('Health Potion', 6, 400), ('Insight Enhancer', 4, 400), ('Curse Cure', 7, 400), ('Sight Enhancer', 6, 400)]
+    for potion, ingredientNumber, magiminsNumber in cases:
+        values, magiminRatio, stock, cover, required = prepare(ingredients, potion, Solver.TRAITS)
+        n = values.shape[0]
+        before, beforeTime = timed(Solver.findBestCombination, values, filteredAfter(n, ingredientNumber, stock, cover, required), magiminRatio, magiminsNumber)
+        after, afterTime = timed(Solver.findBestCombination, values, Solver.iterCombinationChunks(n, ingredientNumber, Solver.CHUNK_SIZE, stock, cover, required), magiminRatio, magiminsNumber)
+        same = before.total == after.total and before.error == after.error and list(before.combination if before.combination is not None else []) == list(after.combination if after.combination is not None else [])
+        print(potion + ", " + str(ingredientNumber) + " ingredients, all traits: " + str(Solver.countCombinations(n, ingredientNumber)) + " combinations, " + str(after.scanned) + " covering the traits, "
+              + "filtered after %.2fs, tracked while enumerating %.2fs, total %d%s" % (beforeTime, afterTime, after.total, "" if same else " (DIFFERENT RESULT)"))
+
+
+def filteredStock(n, k, stock):
+    # Stock checked on finished combinations, as before multiplicities were bounded during the enumeration
+    for chunk in Solver.iterCombinationChunks(n, k, Solver.CHUNK_SIZE):
+        chunk = chunk[Solver.withinStock(chunk, stock)]
+        if chunk.shape[0] > 0:
+            yield chunk
+
+
+def benchmarkStock(ingredients):
+    # Daily limit on, no traits
+    cases = [('Mana Potion', 6, 400), ('Curse Cure', 5, 400), ('Poison Cure', 5, 400)]
+    for potion, ingredientNumber, magiminsNumber in cases:
+        values, magiminRatio, stock, cover, required = prepare(ingredients, potion, dailyLimit=True)
+        n = values.shape[0]
+        count, countTime = timed(Solver.countCombinations, n, ingredientNumber, stock)
+        before, beforeTime = timed(Solver.findBestCombination, values, filteredStock(n, ingredientNumber, stock), magiminRatio, magiminsNumber)
+        after, afterTime = timed(Solver.findBestCombination, values, Solver.iterCombinationChunks(n, ingredientNumber, Solver.CHUNK_SIZE, stock), magiminRatio, magiminsNumber)
+        same = before.total == after.total and before.error == after.error and list(before.combination) == list(after.combination) and count == after.scanned
+        print(potion + ", " + str(ingredientNumber) + " ingredients, daily limit: " + str(Solver.countCombinations(n, ingredientNumber)) + " combinations, " + str(count) + " within the stock (counted in %.3fs), " % countTime
+              + "filtered after %.2fs, bounded while enumerating %.2fs, total %d%s" % (beforeTime, afterTime, after.total, "" if same else " (DIFFERENT RESULT)"))
+
+
+def benchmarkReduction(ingredients):
+    # Every potion, 4 ingredients up to 100 magimins without the daily limit
+    ingredientNumber, magiminsNumber = 4, 100
+    for potion in Solver.POTIONS:
+        values, magiminRatio, stock, cover, required = prepare(ingredients, potion)
+        n = values.shape[0]
+        query = Solver.Query(potion, ingredientNumber, magiminsNumber, False, (), np.ones(len(ingredients.names), dtype=bool))
+        before, beforeTime = timed(Solver.findBestCombination, values, Solver.iterCombinationChunks(n, ingredientNumber), magiminRatio, magiminsNumber)
+        after, afterTime = timed(Solver.solve, ingredients, query)
+        same = before.total == after.total and (before.total == 0 or before.error == after.error)
+        print(potion + ": " + str(after.removed) + " of " + str(n) + " ingredients left out, " + str(before.scanned) + " combinations down to " + str(after.count) + ", "
+              + "all of them %.2fs, reduced %.2fs, total %d%s" % (beforeTime, afterTime, after.total, "" if same else " (DIFFERENT RESULT)"))
+
+
+def benchmarkCaps(ingredients):
+    # Ten caps from 50 to 500 magimins without the daily limit, each searched on its own or looked up in the
+    # brews of every cap
+    caps = range(50, 501, 50)
+    cases = [('Health Potion', 5), ('Sight Enhancer', 4), ('Poison Cure', 4)]
+    for potion, ingredientNumber in cases:
+        query = Solver.Query(potion, ingredientNumber, 0, False, (), np.ones(len(ingredients.names), dtype=bool))
+        searched, searchTime = timed(lambda: [Solver.solve(ingredients, query.withCap(cap)) for cap in caps])
+        brews, brewsTime = timed(Solver.solveCaps, ingredients, query)
+        looked, lookTime = timed(lambda: [brews.result(cap) for cap in caps])
+        same = all((a.names, a.total, a.error) == (b.names, b.total, b.error) for a, b in zip(searched, looked))
+        print(potion + ", " + str(ingredientNumber) + " ingredients, " + str(len(caps)) + " caps: searched one by one %.2fs, " % searchTime
+              + "brews of every cap %.2fs (%d changes up to %d magimins) and looked up in %.4fs%s" % (brewsTime, len(brews.caps), brews.limit, lookTime, "" if same else " (DIFFERENT RESULT)"))
+
+
+def benchmarkUnlock(ingredients):
+    # Brews of every cap without the daily limit, first with one candidate locked which is then unlocked, from
+    # the brews with it locked or from nothing
+    cases = [('Health Potion', 5), ('Sight Enhancer', 4), ('Poison Cure', 4)]
+    for potion, ingredientNumber in cases:
+        candidates = np.flatnonzero(ingredients.potionMasks[potion])
+        unlocked = np.ones(len(ingredients.names), dtype=bool)
+        unlocked[candidates[len(candidates) // 2]] = False
+        query = Solver.Query(potion, ingredientNumber, 400, False, (), unlocked)
+        previous = Solver.solveCaps(ingredients, query)
+        query = query.withCap(400)
+        query.unlocked = np.ones(len(ingredients.names), dtype=bool)
+        full, fullTime = timed(Solver.solveCaps, ingredients, query)
+        delta, deltaTime = timed(Solver.solveCaps, ingredients, query, previous=previous)
+        same = (full.caps, [tuple(brew) for brew in full.brews]) == (delta.caps, [tuple(brew) for brew in delta.brews])
+        print(potion + ", " + str(ingredientNumber) + " ingredients, one unlocked: from nothing " + str(full.scanned) + " combinations in %.2fs, " % fullTime
+              + "from the brews before " + str(delta.scanned) + " combinations in %.2fs%s" % (deltaTime, "" if same and delta.incremental else " (DIFFERENT RESULT)"))
+
+
+BENCHMARKS = {'traits': benchmarkTraits, 'stock': benchmarkStock, 'reduction': benchmarkReduction, 'caps': benchmarkCaps, 'unlock': benchmarkUnlock}
+
+# Shape of the ingredients of Potionomics.xlsx: how many magimins an ingredient has, its daily stock, the range of
+# its magimins and the share of ingredients with or against a trait
+MAGIMIN_COUNTS = {1: 64, 2: 64, 3: 37, 4: 17, 5: 8}
+STOCKS = {1: 46, 2: 33, 4: 56, 10: 55}
+MAGIMIN_RANGE = (3, 60)
+TRAIT_SHARE = 0.08
+
+SUITE_INGREDIENTS = [20, 100, 500]
+SUITE_SLOTS = [4, 8, 14]
+SUITE_POTIONS = ['Health Potion', 'Sight Enhancer']
+SUITE_TRAITS = ['', 'Taste,Aroma']
+CAP_PER_SLOT = 40
+MIN_WALL = 0.1 # cases over quicker are too noisy to compare their rates
+TOLERANCE = 0.25
+
+
+def syntheticIngredients(potion, count, seed=0):
+    # count ingredients shaped like those of the workbook, all of them candidates of potion: each has some of the
+    # magimins of the potion and none of the others. The same arguments always give the same table.
+    magiminUsed, _ = Solver.POTIONS[potion]
+    rng = np.random.default_rng([seed, count, list(Solver.POTIONS).index(potion)])
+    sizes = np.array(list(MAGIMIN_COUNTS))
+    sizes = np.minimum(rng.choice(sizes, count, p=np.array(list(MAGIMIN_COUNTS.values())) / sum(MAGIMIN_COUNTS.values())), len(magiminUsed))
+    magimins = np.zeros((count, len(Solver.MAGIMINS)), dtype=np.int64)
+    for row, size in enumerate(sizes):
+        columns = rng.choice(magiminUsed, size, replace=False)
+        magimins[row, columns] = rng.integers(MAGIMIN_RANGE[0], MAGIMIN_RANGE[1] + 1, size)
+    stock = rng.choice(list(STOCKS), count, p=np.array(list(STOCKS.values())) / sum(STOCKS.values()))
+    traits = rng.choice([-1, 0, 1], (count, len(Solver.TRAITS)), p=[TRAIT_SHARE, 1 - 2 * TRAIT_SHARE, TRAIT_SHARE])
+    # One ingredient has every trait, so that every trait selection has combinations to score
+    traits[0] = 1
+    return Solver.Ingredients(['Ingredient ' + str(n + 1) for n in range(count)], magimins, stock, traits)
+
+
+def writeWorkbook(ingredients, path, sheetName='Ingredients'):
+    # The table laid out like Potionomics.xlsx, so that the GUI or readWorkbook can load it
+    import openpyxl
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = sheetName
+    sheet.append(['Name'] + Solver.MAGIMINS + ['Unlocked', 'Stock'] + Solver.TRAITS)
+    for n, name in enumerate(ingredients.names):
+        sheet.append([name] + ingredients.magimins[n].tolist() + [2 if ingredients.unlocked[n] else 0, int(ingredients.stock[n])] + ingredients.traits[n].tolist())
+    workbook.save(path)
+
+
+def peakMemory():
+    # Peak resident memory of this process in bytes, or None where it cannot be read
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD), ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t), ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaNonPagedPoolUsage', ctypes.c_size_t), ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return int(counters.PeakWorkingSetSize)
+    return None
+
+
+def runCase(case):
+    # One case of the suite in this process, stopped after case['budget'] seconds
+    ingredients = syntheticIngredients(case['potion'], case['ingredients'], case['seed'])
+    traits = [trait for trait in case['traits'].split(',') if trait]
+    query = Solver.Query(case['potion'], case['slots'], CAP_PER_SLOT * case['slots'], case['dailyLimit'], traits, None, case['method'])
+    started = time.perf_counter()
+    result = Solver.solve(ingredients, query, progress=lambda result: time.perf_counter() - started > case['budget'])
+    wall = time.perf_counter() - started
+    return dict(case, wall=wall, count=result.count, scanned=result.scanned, rate=result.scanned / wall if wall > 0 else 0.0, nodes=result.nodes,
+                removed=result.removed, total=result.total, error=result.error, cancelled=result.cancelled, peakMemory=peakMemory())
+
+
+def caseKey(case):
+    return (case['potion'], case['ingredients'], case['slots'], case['traits'], case['dailyLimit'], case['method'])
+
+
+def compare(records, baseline, tolerance):
+    # Cases slower or bigger than in baseline by more than tolerance, as lines to print
+    earlier = {caseKey(record): record for record in baseline['cases']}
+    regressions = []
+    for record in records:
+        before = earlier.get(caseKey(record))
+        if before is None:
+            continue
+        name = "%s, %d ingredients, %d slots, traits %s, daily limit %s" % (record['potion'], record['ingredients'], record['slots'], record['traits'] or 'none', record['dailyLimit'])
+        if before['wall'] >= MIN_WALL and before['rate'] > 0 and record['rate'] < before['rate'] * (1 - tolerance):
+            regressions.append(name + ": %.0f combinations/s, %.0f before" % (record['rate'], before['rate']))
+        if before['peakMemory'] and record['peakMemory'] and record['peakMemory'] > before['peakMemory'] * (1 + tolerance):
+            regressions.append(name + ": peak memory %.1f MB, %.1f MB before" % (record['peakMemory'] / 2 ** 20, before['peakMemory'] / 2 ** 20))
+    return regressions
+
+
+def runSuite(options):
+    cases = [{'potion': potion, 'ingredients': count, 'slots': slots, 'traits': traits, 'dailyLimit': dailyLimit, 'method': options.method, 'seed': options.seed, 'budget': options.budget}
+             for potion, count, slots, traits, dailyLimit in itertools.product(options.potions, options.ingredients, options.slots, options.traits, options.daily)]
+    if options.tables:
+        os.makedirs(options.tables, exist_ok=True)
+        for potion, count in itertools.product(options.potions, options.ingredients):
+            writeWorkbook(syntheticIngredients(potion, count, options.seed), os.path.join(options.tables, "%s %d.xlsx" % (potion, count)))
+    baseline = None
+    if options.baseline:
+        # Read first, as the output may replace it
+        with open(options.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+    records = []
+    for case in cases:
+        # A process per run, so that the peak memory is the run's own
+        runs = []
+        for _ in range(options.repeat):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', json.dumps(case)], check=True, capture_output=True, text=True).stdout
+            runs.append(json.loads(output.splitlines()[-1]))
+        # The run of median speed, with the speed of every run
+        record = dict(sorted(runs, key=lambda run: run['rate'])[len(runs) // 2], rates=[run['rate'] for run in runs])
+        records.append(record)
+        print("%s, %d ingredients, %d slots, traits %s, daily limit %s: %d combinations in %.2fs%s, %.0f/s, peak memory %s" % (
+            record['potion'], record['ingredients'], record['slots'], record['traits'] or 'none', record['dailyLimit'], record['scanned'], record['wall'],
+            " (stopped, %d in all)" % record['count'] if record['cancelled'] else "", record['rate'],
+            "unknown" if record['peakMemory'] is None else "%.1f MB" % (record['peakMemory'] / 2 ** 20)), flush=True)
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as file:
+            json.dump({'python': platform.python_version(), 'platform': platform.platform(), 'numpy': np.__version__, 'cases': records}, file, indent=1)
+    if baseline is not None:
+        regressions = compare(records, baseline, options.tolerance)
+        for line in regressions:
+            print("Slower than the baseline: " + line)
+        if regressions:
+            return 1
+    return 0
+
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(description="Benchmarks of the solver.")
+    parser.add_argument('names', nargs='*', help="benchmarks to run out of " + ", ".join(list(BENCHMARKS) + ['suite']) + ", all but suite by default")
+    parser.add_argument('--ingredients', nargs='+', type=int, default=SUITE_INGREDIENTS, help="ingredient counts of the suite")
+    parser.add_argument('--slots', nargs='+', type=int, default=SUITE_SLOTS, help="slot counts of the suite")
+    parser.add_argument('--potions', nargs='+', default=SUITE_POTIONS, choices=list(Solver.POTIONS), help="potions of the suite")
+    parser.add_argument('--traits', nargs='+', default=SUITE_TRAITS, help="trait selections of the suite, comma separated, '' for none")
+    parser.add_argument('--daily', nargs='+', type=lambda text: text.lower() in ('1', 'true', 'yes', 'on'), default=[False, True], help="daily limit settings of the suite")
+    parser.add_argument('--method', default='Exhaustive', choices=Solver.SEARCH_METHODS, help="search method of the suite")
+    parser.add_argument('--budget', type=float, default=2.0, help="seconds a case of the suite may run before it is stopped")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic ingredient tables")
+    parser.add_argument('--tables', help="folder to save the synthetic ingredient tables to as workbooks")
+    parser.add_argument('--output', help="json file to write the measurements of the suite to")
+    parser.add_argument('--repeat', type=int, default=3, help="runs of each case of the suite, the one of median speed being kept")
+    parser.add_argument('--baseline', help="earlier --output to compare with, such as benchmarks/baseline.json, exiting with 1 when a case got slower")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="share by which a case may be slower than the baseline")
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parseArguments(sys.argv[1:] if argv is None else argv)
+    if options.case:
+        print(json.dumps(runCase(json.loads(options.case))))
+        return 0
+    for name in options.names:
+        if name not in BENCHMARKS and name != 'suite':
+            raise SystemExit("Unknown benchmark: " + name)
+    for trait in itertools.chain.from_iterable(traits.split(',') for traits in options.traits):
+        if trait and trait not in Solver.TRAITS:
+            raise SystemExit("Unknown trait: " + trait)
+    names = options.names or list(BENCHMARKS)
+    if any(name != 'suite' for name in names):
+        ingredients = Solver.loadIngredients(EXCEL_LOC)
+        for name in names:
+            if name != 'suite':
+                BENCHMARKS[name](ingredients)
+    return runSuite(options) if 'suite' in names else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
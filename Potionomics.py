@@ -1,4 +1,7 @@
+import argparse
+import json
 import sys
+import time
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtCore import Qt, QEvent
 from PyQt5.QtWidgets import (QAction, QApplication, QCheckBox, QComboBox, QDateTimeEdit,
@@ -7,9 +10,7 @@ from PyQt5.QtWidgets import (QAction, QApplication, QCheckBox, QComboBox, QDateT
         QSlider, QSpinBox, QDoubleSpinBox, QStyleFactory, QTableWidget, QTabWidget, QTextEdit,
         QVBoxLayout, QWidget, QFileDialog, QLineEdit, QStyledItemDelegate, QTableView, qApp)
 import numpy as np
-import pandas as pd
-import itertools
-from sklearn.metrics import mean_squared_error
+import Solver
 
 class HeaderView(QtWidgets.QHeaderView):
     # Credit: https://stackoverflow.com/questions/61500139/what-is-the-best-widget-in-pyqt5-to-show-a-checked-list-with-columns
@@ -193,207 +194,430 @@ class CheckableComboBox(QComboBox):
                 res.append(self.model().item(i).data())
         return res
 
+class IngredientTableModel(QtCore.QAbstractTableModel):
+    # The ingredient table read straight from the arrays of a Solver.Ingredients, the check boxes being its
+    # unlocked mask, so no item is built per cell and checking every row is one update of the column.
+    # unlockedChanged is emitted with the rows and their new state whenever the user changes them.
+    unlockedChanged = QtCore.pyqtSignal(list, bool)
+    HEADERS = ["", "Name"] + Solver.MAGIMINS
+
+    def __init__(self, ingredients, parent=None):
+        super().__init__(parent)
+        self.names = ingredients.names
+        self.magimins = ingredients.magimins
+        self.unlocked = ingredients.unlocked
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.names)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        if column == 0:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if self.unlocked[row] else Qt.Unchecked
+            return None
+        if role == Qt.DisplayRole:
+            return self.names[row] if column == 1 else str(self.magimins[row, column - 2])
+        return None
+
+    def flags(self, index):
+        if index.column() == 0:
+            return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or index.column() != 0 or role != Qt.CheckStateRole:
+            return False
+        state = value == Qt.Checked
+        self.unlocked[index.row()] = state
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        self.unlockedChanged.emit([index.row()], state)
+        return True
+
+    def setAllUnlocked(self, state):
+        rows = np.flatnonzero(self.unlocked != state).tolist()
+        self.unlocked[:] = state
+        self.dataChanged.emit(self.index(0, 0), self.index(len(self.names) - 1, 0), [Qt.CheckStateRole])
+        if rows:
+            self.unlockedChanged.emit(rows, state)
+
+class SearchWorker(QtCore.QThread):
+    # Runs Model.findBestIngredients away from the GUI thread and reports the best combination found so far
+    progressed = QtCore.pyqtSignal(object, object, float, list, int) # scored, to score (0 if unknown), seconds left (-1 if unknown), best solution, best total
+    found = QtCore.pyqtSignal(list, int)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, model, query, parent=None):
+        super().__init__(parent)
+        self._model = model
+        self.query = query
+        self._cancelled = False
+        self.search = None # Solver result once the search is over
+        self._started = 0
+        self._reported = 0
+        self._bestTotal = 0
+
+    def cancel(self):
+        self._cancelled = True
+
+    def report(self, result):
+        now = time.monotonic()
+        scanned, total, names, totalMagimins = self._model.describe(result)
+        # Keep the GUI responsive by reporting at most ten times a second unless the best improved
+        if totalMagimins != self._bestTotal or now - self._reported >= 0.1:
+            self._reported = now
+            self._bestTotal = totalMagimins
+            if total > 0 and scanned > 0:
+                eta = (now - self._started) * (total - scanned) / scanned
+            else:
+                eta = -1
+            self.progressed.emit(scanned, total, eta, names, totalMagimins)
+        return self._cancelled
+
+    def run(self):
+        self._started = time.monotonic()
+        try:
+            names, totalMagimins = self._model.findBestIngredients(*self.query, progress=self.report)
+        except Exception as error:
+            self.failed.emit(str(error))
+            return
+        self.search = self._model.search
+        self.found.emit(names, totalMagimins)
+
 class Controller:
     def __init__(self, model, view):
         self._model = model
         self._view = view
+        self._worker = None
+        self._planning = False
         self.buttonResponse()
         self.loadExistingData()
 
     def loadExistingData(self):
-        self._view.ingredientTableData = self._model.getExistingData(self._view.ingredientTableData)
+        self._view.ingredientTableData = self._model.getExistingData(self._view)
         self._view.ingredientTable.setModel(self._view.ingredientTableData)
         self._view.ingredientTable.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.ResizeToContents)
         self._view.ingredientTable.horizontalHeader().setStretchLastSection(True)
+        self._view.ingredientTableData.unlockedChanged.connect(self.recordUnlocked)
+        self.showStats(self._model.stats)
+        self.logStats('load', self._model.stats)
+
+    def recordUnlocked(self, rows, state):
+        self._model.setUnlocked(rows, state)
+
+    def logStats(self, event, stats, **fields):
+        try:
+            self._model.logStats(event, stats, **fields)
+        except OSError as error:
+            QtWidgets.QMessageBox.warning(self._view, "Search stats", "Could not write " + self._model.statsLog + ": " + str(error))
+
+    def exportWorkbook(self):
+        try:
+            self._model.exportWorkbook(self._model.getUnlockedStates(self._view.ingredientTableData))
+        except Exception as error:
+            QtWidgets.QMessageBox.warning(self._view, "Export to Excel", "Could not write " + self._model.excelLoc + ": " + str(error))
     
     def calculateMagimins(self):
-        self._view.solutionTableData = QtGui.QStandardItemModel(0, 2, self._view)
-        self._view.solutionTableData, totalMagimins = self._model.getBestCombination(self._view.ingredientTableData, self._view.solutionTableData, self._view.ingredientNumber.value(), self._view.magiminsNumber.value(), self._view.potionMaking.currentText(), self._view.dailyIngredientLimit.currentText(), self._view.traitSelection.currentData())
+        if self._worker is not None:
+            # The button reads "Cancel" while a search is running
+            self._worker.cancel()
+            return
+        query = self.currentQuery()
+        # One row per potion instead of one row per ingredient
+        self._planning = isinstance(query[3], list)
+        self._worker = SearchWorker(self._model, query, self._view)
+        self._worker.progressed.connect(self.showProgress)
+        self._worker.found.connect(self.showSolution)
+        self._worker.failed.connect(self.showFailure)
+        self._worker.finished.connect(self.searchFinished)
+        self._view.searchWorker = self._worker
+        self._view.calculateButton.setText("Cancel")
+        if query[-1] == 'Branch and Bound' and not self._planning:
+            self._view.searchProgress.setRange(0, 0)
+            self._view.searchProgress.setFormat("")
+        else:
+            count, seconds = self._model.estimateSearch(*query)
+            self._view.searchProgress.setRange(0, 1000)
+            self._view.searchProgress.setValue(0)
+            self._view.searchProgress.setFormat("0 / " + str(count) + " combinations" + (", about " + str(int(seconds)) + "s" if seconds >= 0 else ""))
+        self.showSolution([], 0)
+        self._shownTotal = -1
+        self._worker.start()
+
+    def currentQuery(self):
+        states = self._model.getUnlockedStates(self._view.ingredientTableData)
+        potionMaking = self._view.potionMaking.currentText()
+        if potionMaking == Solver.ALL_POTIONS:
+            potionMaking = [self._view.potionMaking.itemText(i) for i in range(self._view.potionMaking.count()) if self._view.potionMaking.itemText(i) != Solver.ALL_POTIONS]
+        return (states, self._view.ingredientNumber.value(), self._view.magiminsNumber.value(), potionMaking, self._view.dailyIngredientLimit.currentText(), self._view.traitSelection.currentData(), self._view.searchMethod.currentText())
+
+    def capChanged(self, magiminsNumber):
+        # The last search found the brews of every cap, so a new cap is a lookup instead of a new search
+        if self._worker is not None:
+            return
+        result = self._model.lookupCap(*self.currentQuery())
+        if result is not None:
+            self._planning = False
+            self.showSolution(result.names, result.total)
+            self._view.totalMagimins.setToolTip("Looked up in the brews by number of magimins")
+
+    def capSelected(self, index):
+        self._view.magiminsNumber.setValue(int(self._view.capTableData.item(index.row(), 0).text()))
+
+    def showCaps(self, brews):
+        # Empty when the last search only found the brew of one cap
+        self._view.capTableData = self._model.fillCapTable(QtGui.QStandardItemModel(0, 3, self._view), brews)
+        self._view.capTable.setModel(self._view.capTableData)
+        self._view.capTable.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.ResizeToContents)
+        self._view.capTable.horizontalHeader().setSectionResizeMode(1, QtWidgets.QHeaderView.ResizeToContents)
+        self._view.capTable.horizontalHeader().setStretchLastSection(True)
+
+    def showProgress(self, scanned, total, eta, names, totalMagimins):
+        if total > 0:
+            self._view.searchProgress.setRange(0, 1000)
+            self._view.searchProgress.setValue(int(1000 * scanned / total))
+            self._view.searchProgress.setFormat(str(scanned) + " / " + str(total) + " combinations" + (", " + str(int(eta)) + "s left" if eta >= 0 else ""))
+        else:
+            self._view.searchProgress.setRange(0, 0)
+        if totalMagimins != self._shownTotal:
+            # The best total only grows, so the best-so-far table is only rebuilt when it improves
+            self.showSolution(names, totalMagimins)
+
+    def showSolution(self, names, totalMagimins):
+        started = time.perf_counter()
+        if self._planning:
+            self._view.solutionTableData = self._model.fillPlanTable(QtGui.QStandardItemModel(0, 3, self._view), names)
+        else:
+            self._view.solutionTableData = self._model.fillSolutionTable(QtGui.QStandardItemModel(0, 2, self._view), names)
         self._view.solutionTable.setModel(self._view.solutionTableData)
         self._view.solutionTable.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.ResizeToContents)
         self._view.solutionTable.horizontalHeader().setStretchLastSection(True)
-        self._view.totalMagimins.setText("Total Magimins: " + str(totalMagimins))
+        self._view.totalMagimins.setText(("Total Magimins of all brews: " if self._planning else "Total Magimins: ") + str(totalMagimins))
+        self._shownTotal = totalMagimins
+        # Only the last table, which shows the solution found, is counted in the stats of the search
+        self._tableSeconds = time.perf_counter() - started
+
+    def showStats(self, stats):
+        # Seconds per phase on the first line and the main counters, if any, on the second, all of them in the
+        # tooltip
+        phases = ", ".join(phase + " %.3fs" % seconds for phase, seconds in stats.phases.items())
+        counters = stats.counters
+        labels = (('scored', "scored"), ('improved', "improved"), ('rejectedByStock', "over the stock"), ('rejectedByTraits', "lacking traits"))
+        shown = [str(counters[counter]) + " " + label for counter, label in labels if counters.get(counter)]
+        self._view.searchStats.setText(phases + ("\n" + ", ".join(shown) if shown else ""))
+        self._view.searchStats.setToolTip("\n".join(counter + ": " + str(number) for counter, number in counters.items()))
+
+    def showFailure(self, message):
+        self._view.totalMagimins.setText("Search failed: " + message)
+
+    def searchFinished(self):
+        search = self._worker.search
+        query = self._worker.query
+        searchMethod = query[-1]
+        # The thread is over, so its QThread can go instead of living as long as the window
+        self._worker.deleteLater()
+        self._worker = None
+        self._view.searchWorker = None
+        self._view.calculateButton.setText("Calculate")
+        self._view.searchProgress.setRange(0, 1000)
+        self._view.searchProgress.setValue(0 if search is None or search.cancelled else 1000)
+        self._view.searchProgress.setFormat("Cancelled" if search is not None and search.cancelled else "")
+        if search is None:
+            return
+        started = time.perf_counter()
+        self.showCaps(self._model.capBrews)
+        stats = self._model.stats
+        stats.add('table', self._tableSeconds + time.perf_counter() - started)
+        self.showStats(stats)
+        states, ingredientNumber, magiminsNumber, potionMaking, dailyIngredientLimit, traitSelection, searchMethod = query
+        self.logStats('search', stats, potion=potionMaking, ingredientNumber=ingredientNumber, magiminsNumber=magiminsNumber, dailyLimit=dailyIngredientLimit == "Yes",
+                      traits=traitSelection, searchMethod=searchMethod, totalMagimins=self._shownTotal, cancelled=search.cancelled, cached=search.cached)
+        if search.cached:
+            results = self._model.results
+            self._view.totalMagimins.setToolTip("Found in the result cache (" + str(results.hits) + " hits, " + str(results.misses) + " misses)")
+        elif searchMethod == 'Branch and Bound' and not isinstance(search, Solver.Plan):
+            self._view.totalMagimins.setToolTip("Nodes explored: " + str(search.nodes) + ", pruned: " + str(search.pruned))
+        elif self._model.capBrews is not None and self._model.capBrews.incremental:
+            self._view.totalMagimins.setToolTip("Combinations scored: " + str(search.scanned) + ", only those with the newly unlocked ingredients")
+        else:
+            self._view.totalMagimins.setToolTip("Combinations scored: " + str(search.scanned))
+        if isinstance(search, Solver.Result) and search.removed:
+            self._view.totalMagimins.setToolTip(self._view.totalMagimins.toolTip() + " (" + str(search.removed) + " ingredients left out beforehand)")
 
     def buttonResponse(self):
         self._view.calculateButton.pressed.connect(self.calculateMagimins)
+        self._view.exportButton.pressed.connect(self.exportWorkbook)
+        self._view.magiminsNumber.valueChanged.connect(self.capChanged)
+        self._view.capTable.clicked.connect(self.capSelected)
 
 class Model:
-    def __init__(self):
-        1
-
-    def getExistingData(self, ingredientTableData):
+    def __init__(self, chunkSize=Solver.CHUNK_SIZE, workers=None, statsLog=None):
+        # Number of combinations enumerated and scored at a time
+        self.chunkSize = chunkSize
+        # Number of processes of the parallel search, all the cores by default
+        self.workers = workers
+        # Combinations scored per second by the last search of each method, to estimate how long the next one takes
+        self.rates = {}
+        # Brews of every cap found by the last search, see Solver.solveCaps
+        self.capBrews = None
+        # Brews with a frontier to go on from when ingredients are unlocked, by potion, ingredient number, daily
+        # limit and traits
+        self.capStates = {}
+        # Timings and counters of the last load or search, also appended to statsLog as json lines if given
+        self.stats = Solver.SearchStats()
+        self.statsLog = statsLog
+
+    def getExistingData(self, parent=None):
         self.excelLoc = './Potionomics.xlsx'
-        self.data = pd.read_excel(self.excelLoc, 'Ingredients', skiprows = 0)
-        self.data = self.data.replace(np.nan, 0)
-
-        ingredientTableData.setHorizontalHeaderLabels(["", "Name", "A", "B", "C", "D", "E", "F"])
-        for n in range(self.data.shape[0]):
-            it_state = QtGui.QStandardItem()
-            it_state.setEditable(False)
-            it_state.setCheckable(True)
-            if self.data.iloc[n, 7] != 2:
-                state = False
-            else:
-                state = True
-            it_state.setCheckState(QtCore.Qt.Checked if state else 0)
-            it_name = QtGui.QStandardItem(str(self.data.iloc[n, 0]))
-            it_a = QtGui.QStandardItem(str(self.data.iloc[n, 1]))
-            it_b = QtGui.QStandardItem(str(self.data.iloc[n, 2]))
-            it_c = QtGui.QStandardItem(str(self.data.iloc[n, 3]))
-            it_d = QtGui.QStandardItem(str(self.data.iloc[n, 4]))
-            it_e = QtGui.QStandardItem(str(self.data.iloc[n, 5]))
-            it_f = QtGui.QStandardItem(str(self.data.iloc[n, 6]))
-            ingredientTableData.appendRow([it_state, it_name, it_a, it_b, it_c, it_d, it_e, it_f])
-        return ingredientTableData       
-
-    def getBestCombination(self, ingredientTableData, solutionTableData, ingredientNumber, magiminsNumber, potionMaking, dailyIngredientLimit, traitSelection):
-        states = np.zeros((ingredientTableData.rowCount(), 1))
-        for i in range(ingredientTableData.rowCount()):
-            states[i] = ingredientTableData.item(i, 0).checkState()
-        self.data['Unlocked'] = states
-        unlockedIngredients = self.data.loc[self.data["Unlocked"] == 2,]
-        if potionMaking == 'Health Potion':
-            magiminUsed = [1, 2]
-            magiminRatio = [1, 1]
-        elif potionMaking == 'Mana Potion':
-            magiminUsed = [2, 3]
-            magiminRatio = [1, 1]
-        elif potionMaking ==  'Stamina Potion':
-            magiminUsed = [1, 5]
-            magiminRatio = [1, 1]
-        elif potionMaking ==  'Speed Potion':
-            magiminUsed = [3, 4]
-            magiminRatio = [1, 1]
-        elif potionMaking ==  'Tolerance Potion':
-            magiminUsed = [4, 5]
-            magiminRatio = [1, 1]
-        elif potionMaking ==  'Fire Tonic':
-            magiminUsed = [1, 3]
-            magiminRatio = [1, 1]
-        elif potionMaking ==  'Ice Tonic':
-            magiminUsed = [1, 4]
-            magiminRatio = [1, 1]
-        elif potionMaking ==  'Thunder Tonic':
-            magiminUsed = [2, 4]
-            magiminRatio = [1, 1]
-        elif potionMaking ==  'Shadow Tonic':
-            magiminUsed = [2, 5]
-            magiminRatio = [1, 1]
-        elif potionMaking ==  'Radiation Tonic':
-            magiminUsed = [3, 5]
-            magiminRatio = [1, 1]
-        elif potionMaking ==  'Sight Enhancer':
-            magiminUsed = [1, 2, 3]
-            magiminRatio = [3, 4, 3]
-        elif potionMaking ==  'Alertness Enhancer':
-            magiminUsed = [2, 3, 4]
-            magiminRatio = [3, 4, 3]
-        elif potionMaking ==  'Insight Enhancer':
-            magiminUsed = [1, 2, 5]
-            magiminRatio = [4, 3, 4]
-        elif potionMaking ==  'Dowsing Enhancer':
-            magiminUsed = [1, 4, 5]
-            magiminRatio = [3, 3, 4]
-        elif potionMaking ==  'Seeking Enhancer':
-            magiminUsed = [3, 4, 5]
-            magiminRatio = [3, 4, 3]
-        elif potionMaking ==  'Poison Cure':
-            magiminUsed = [1, 3, 4]
-            magiminRatio = [2, 1, 1]
-        elif potionMaking ==  'Drowsiness Cure':
-            magiminUsed = [1, 2, 4]
-            magiminRatio = [1, 1, 2]
-        elif potionMaking ==  'Petrification Cure':
-            magiminUsed = [1, 3, 5]
-            magiminRatio = [1, 2, 1]
-        elif potionMaking ==  'Silence Cure':
-            magiminUsed = [2, 3, 5]
-            magiminRatio = [2, 1, 1]
-        elif potionMaking ==  'Curse Cure':
-            magiminUsed = [2, 3, 5]
-            magiminRatio = [1, 1, 1]
-        usefulIngredients = unlockedIngredients.loc[(unlockedIngredients.iloc[:, magiminUsed] > 0).any(axis=1), :]
-        # Testing no other magimins
-        fullList = [1, 2, 3, 4, 5, 6]
-        magiminValues = {}
-        for n in range(len(magiminUsed)):
-            fullList.remove(magiminUsed[n])
-        choosenIngredients = usefulIngredients.loc[(usefulIngredients.iloc[:, fullList] == 0).all(axis=1), :]
-        choosenIngredients.reset_index(drop = True, inplace = True)
-        # Select Traits
-        if len(traitSelection) > 0:
-            for n in range(len(traitSelection)):
-                choosenIngredients = choosenIngredients.drop(choosenIngredients.loc[choosenIngredients[traitSelection[n]] < 0,].index)
-            choosenIngredients.reset_index(drop = True, inplace = True)
-            traitIngredients = {}
-            for n in range(len(traitSelection)):
-                traitIngredients[n] = set(list(choosenIngredients.loc[choosenIngredients[traitSelection[n]] > 0,].index))
-            commonTraitIngredients = set.intersection(*traitIngredients.values())
-            commonTraitIngredients = list(commonTraitIngredients)
-
-
-        for n in range(len(magiminUsed)):
-            magiminValues[n] = choosenIngredients.iloc[:,magiminUsed[n]]
-        ingredientsNumbers = [*range(len(choosenIngredients))]
-        if  (dailyIngredientLimit == "Yes") and (len(traitSelection) > 0):
-            combs = []
-            for item in itertools.combinations_with_replacement(ingredientsNumbers, ingredientNumber):
-                unique = list(set(item))
-                dailyLimit = False
-                for n in range(len(unique)):
-                    if item.count(unique[n]) > choosenIngredients.iloc[unique[n], 8]:
-                        dailyLimit = True
-                if dailyLimit == False:
-                    traitIngredientsCombi = []
-                    for n in range(len(traitSelection)):
-                        traitIngredientsCombi.append(any(ingredient in traitIngredients[n] for ingredient in unique))
-                    if (any(ingredient in commonTraitIngredients for ingredient in unique)) or (all(traitIngredientsCombi)):
-                        combs.append(list(item))
-        elif len(traitSelection) > 0:
-            combs = []
-            for item in itertools.combinations_with_replacement(ingredientsNumbers, ingredientNumber):
-                unique = list(set(item))
-                traitIngredientsCombi = []
-                for n in range(len(traitSelection)):
-                    traitIngredientsCombi.append(any(ingredient in traitIngredients[n] for ingredient in unique))
-                if (any(ingredient in commonTraitIngredients for ingredient in unique)) or (all(traitIngredientsCombi)):
-                    combs.append(list(item))
-        elif dailyIngredientLimit == "Yes":
-            combs = []
-            for item in itertools.combinations_with_replacement(ingredientsNumbers, ingredientNumber):
-                unique = list(set(item))
-                dailyLimit = False
-                for n in range(len(unique)):
-                    if item.count(unique[n]) > choosenIngredients.iloc[unique[n], 8]:
-                        dailyLimit = True
-                if dailyLimit == False:
-                    combs.append(list(item))
+        self.stats = Solver.SearchStats()
+        # Read from the binary cache next to the workbook, which is only rebuilt when the workbook changes
+        with self.stats.phase('load'):
+            self.ingredients = Solver.loadIngredients(self.excelLoc)
+            self.results = Solver.ResultCache(Solver.resultsPath(self.excelLoc))
+        # The table shows the ingredient arrays as they are, its check boxes being self.ingredients.unlocked
+        with self.stats.phase('table'):
+            ingredientTableData = IngredientTableModel(self.ingredients, parent)
+        return ingredientTableData
+
+    def setUnlocked(self, rows, state):
+        # Saved right away in the unlock log next to the workbook, which is much cheaper than rewriting it
+        self.ingredients.unlocked[rows] = state
+        Solver.recordUnlocked(self.excelLoc, [self.ingredients.names[row] for row in rows], state)
+
+    def exportWorkbook(self, states):
+        Solver.exportUnlocked(self.excelLoc, self.ingredients.names, states)
+
+    def getUnlockedStates(self, ingredientTableData):
+        # A copy of the unlocked mask, which the query keeps while the table can still be changed
+        return ingredientTableData.unlocked.copy()
+
+    def findBestIngredients(self, states, ingredientNumber, magiminsNumber, potionMaking, dailyIngredientLimit, traitSelection, searchMethod='Exhaustive', progress=None):
+        # Does not touch any Qt object so that it can run on a worker thread. progress is called with the
+        # Solver.Result so far and stops the search by returning True. A list of potions is searched in one
+        # pass, giving a Solver.Plan and one row per potion.
+        started = time.monotonic()
+        self.capBrews = None
+        self.stats = Solver.SearchStats()
+        if isinstance(potionMaking, list):
+            queries = [self.makeQuery(states, ingredientNumber, magiminsNumber, potion, dailyIngredientLimit, traitSelection, searchMethod) for potion in potionMaking]
+            self.search = Solver.solveAll(self.ingredients, queries, progress, self.chunkSize, self.results, self.stats)
+            searchMethod = Solver.ALL_POTIONS
+        elif searchMethod == 'Branch and Bound':
+            query = self.makeQuery(states, ingredientNumber, magiminsNumber, potionMaking, dailyIngredientLimit, traitSelection, searchMethod)
+            self.search = Solver.solve(self.ingredients, query, progress, self.workers, self.chunkSize, self.results, self.stats)
         else:
-            combs = list(itertools.combinations_with_replacement(ingredientsNumbers, ingredientNumber))
-        result = [0, 0, 100] # combs number, max magimins, mean square error from ideal ratio
-        for n in range(len(combs)):
-            lst = []
-            for m in range(len(magiminUsed)):
-                lst.append(sum(magiminValues[m].iloc[list(combs[n])]))
-            if 0 not in lst:
-                magiminRatioGet = np.array(lst)
-                np.seterr(divide='ignore', invalid='ignore')
-                magiminRatioGet = magiminRatioGet / min(magiminRatioGet)
-                error = mean_squared_error(magiminRatio, magiminRatioGet)
-                if (sum(lst) > result[1]) and (error <= result[2]) and (sum(lst) <= magiminsNumber):
-                    result = [n, sum(lst), error]
-        ans = choosenIngredients.iloc[list(combs[result[0]]), 0]
+            # Scans every combination anyway, so the brews of every cap are found in the same pass
+            query = self.makeQuery(states, ingredientNumber, magiminsNumber, potionMaking, dailyIngredientLimit, traitSelection, searchMethod)
+            key = self.stateKey(query)
+            brews = Solver.solveCaps(self.ingredients, query, progress, self.workers, self.chunkSize, self.results, self.capStates.get(key), self.stats)
+            self.capBrews = None if brews.cancelled else brews
+            if brews.frontier is not None:
+                self.capStates[key] = brews
+            self.search = brews.result(magiminsNumber)
+        elapsed = time.monotonic() - started
+        if searchMethod != 'Branch and Bound' and not self.search.cached and not self.search.cancelled and elapsed > 0.1:
+            self.rates[searchMethod] = self.search.scanned / elapsed
+        return self.describe(self.search)[2:]
+
+    def logStats(self, event, stats, **fields):
+        # One json line per load or search, with the fields given, the seconds of each phase and the counters
+        if self.statsLog is None:
+            return
+        record = dict({'event': event, 'time': time.time()}, **fields)
+        record.update(stats.asDict())
+        with open(self.statsLog, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record) + "\n")
+
+    def describe(self, search):
+        # Progress of a search as scored, to score (0 if unknown), solution and its total magimins. The solution
+        # of a Solver.Plan is a row of potion, total magimins and ingredients per potion.
+        if isinstance(search, Solver.Plan):
+            rows = [[result.query.potion, result.total, result.names] for result in search.results]
+            return search.scanned, search.count, rows, sum(result.total for result in search.results)
+        if search.query.searchMethod == 'Branch and Bound':
+            # The number of nodes to explore is not known in advance
+            return search.nodes, 0, search.names, search.total
+        return search.scanned, search.count, search.names, search.total
+
+    def stateKey(self, query):
+        return query.potion, query.ingredientNumber, query.dailyLimit, tuple(sorted(query.traits))
+
+    def lookupCap(self, states, ingredientNumber, magiminsNumber, potionMaking, dailyIngredientLimit, traitSelection, searchMethod='Exhaustive'):
+        # Result of the query from the brews of the last search, None unless it only differed by the cap
+        if self.capBrews is None or isinstance(potionMaking, list) or searchMethod == 'Branch and Bound':
+            return None
+        query = self.makeQuery(states, ingredientNumber, magiminsNumber, potionMaking, dailyIngredientLimit, traitSelection, searchMethod)
+        last = self.capBrews.query
+        if (query.potion, query.ingredientNumber, query.dailyLimit, sorted(query.traits)) != (last.potion, last.ingredientNumber, last.dailyLimit, sorted(last.traits)) or not np.array_equal(query.unlocked, last.unlocked):
+            return None
+        return self.capBrews.result(magiminsNumber)
+
+    def makeQuery(self, states, ingredientNumber, magiminsNumber, potionMaking, dailyIngredientLimit, traitSelection, searchMethod='Exhaustive'):
+        return Solver.Query(potionMaking, ingredientNumber, magiminsNumber, dailyIngredientLimit == "Yes", traitSelection, states, searchMethod)
+
+    def estimateSearch(self, *query):
+        # Number of combinations to score, and how many seconds that takes at the speed of the last search with
+        # the same method (-1 before the first one)
+        states, ingredientNumber, magiminsNumber, potionMaking, dailyIngredientLimit, traitSelection, searchMethod = query
+        if isinstance(potionMaking, list):
+            queries = [self.makeQuery(states, ingredientNumber, magiminsNumber, potion, dailyIngredientLimit, traitSelection, searchMethod) for potion in potionMaking]
+            count = Solver.countPlan(self.ingredients, queries)
+            searchMethod = Solver.ALL_POTIONS
+        elif searchMethod == 'Branch and Bound':
+            count = Solver.countQuery(self.ingredients, self.makeQuery(*query))
+        else:
+            query = self.makeQuery(*query)
+            count = Solver.countCaps(self.ingredients, query, self.capStates.get(self.stateKey(query)))
+        rate = self.rates.get(searchMethod)
+        return count, count / rate if rate else -1
 
+    def fillSolutionTable(self, solutionTableData, names):
         solutionTableData.setHorizontalHeaderLabels(["", "Name"])
-        for n in range(ans.shape[0]):
+        for n in range(len(names)):
             it_state = QtGui.QStandardItem()
             it_state.setEditable(False)
             it_state.setCheckable(True)
             state = False
             it_state.setCheckState(QtCore.Qt.Checked if state else 0)
-            it_name = QtGui.QStandardItem(str(ans.iloc[n]))
+            it_name = QtGui.QStandardItem(names[n])
             solutionTableData.appendRow([it_state, it_name])
-        return solutionTableData, result[1]
+        return solutionTableData
+
+    def fillPlanTable(self, solutionTableData, rows):
+        solutionTableData.setHorizontalHeaderLabels(["Potion", "Total", "Ingredients"])
+        for potion, totalMagimins, names in rows:
+            it_potion = QtGui.QStandardItem(potion)
+            it_potion.setEditable(False)
+            it_total = QtGui.QStandardItem(str(totalMagimins))
+            it_total.setEditable(False)
+            it_names = QtGui.QStandardItem(", ".join(names))
+            it_names.setEditable(False)
+            solutionTableData.appendRow([it_potion, it_total, it_names])
+        return solutionTableData
+
+    def fillCapTable(self, capTableData, brews):
+        capTableData.setHorizontalHeaderLabels(["Magimins", "Total", "Ingredients"])
+        if brews is None:
+            return capTableData
+        for cap, (names, totalMagimins, error) in zip(brews.caps, brews.brews):
+            it_cap = QtGui.QStandardItem(str(cap))
+            it_cap.setEditable(False)
+            it_total = QtGui.QStandardItem(str(totalMagimins))
+            it_total.setEditable(False)
+            it_names = QtGui.QStandardItem(", ".join(names))
+            it_names.setEditable(False)
+            capTableData.appendRow([it_cap, it_total, it_names])
+        return capTableData
 
 class MagiminsCalculator(QtWidgets.QDialog):
     def __init__(self, parent=None):
@@ -402,7 +626,7 @@ class MagiminsCalculator(QtWidgets.QDialog):
         self.setWindowFlag(Qt.WindowMinimizeButtonHint, True)
         self.setWindowFlag(Qt.WindowMaximizeButtonHint, True)
 
-        self.ingredientTableData = QtGui.QStandardItemModel(0, 4, self)
+        self.ingredientTableData = None # an IngredientTableModel once the workbook is loaded
         self.ingredientTable = QTableView(showGrid=False, selectionBehavior=QtWidgets.QAbstractItemView.SelectRows)
         headerview = HeaderView(QtCore.Qt.Horizontal, self.ingredientTable)
         headerview.checkable_column = 0
@@ -423,11 +647,12 @@ class MagiminsCalculator(QtWidgets.QDialog):
         ingredientNumberLabel = QLabel()
         ingredientNumberLabel.setText("Number of Ingredients:")
         self.ingredientNumber = QSpinBox()
+        self.ingredientNumber.setMaximum(Solver.MAX_INGREDIENTS)
         self.ingredientNumber.setValue(4)
         magiminsNumberLabel = QLabel()
         magiminsNumberLabel.setText("Number of Magimins:")
         self.magiminsNumber = QSpinBox()
-        self.magiminsNumber.setMaximum(2000)
+        self.magiminsNumber.setMaximum(Solver.MAX_MAGIMINS)
         self.magiminsNumber.setValue(120)
         potionMakingLabel = QLabel()
         potionMakingLabel.setText("Potion to Craft:")
@@ -451,6 +676,7 @@ class MagiminsCalculator(QtWidgets.QDialog):
         self.potionMaking.addItem('Petrification Cure')
         self.potionMaking.addItem('Silence Cure')
         self.potionMaking.addItem('Curse Cure')
+        self.potionMaking.addItem(Solver.ALL_POTIONS)
         dailyLabel = QLabel()
         dailyLabel.setText("Limit Ingredients To Daily Limit:")
         self.dailyIngredientLimit = QComboBox()
@@ -462,13 +688,37 @@ class MagiminsCalculator(QtWidgets.QDialog):
         self.traitSelection.addItem("Aroma")
         self.traitSelection.addItem("Visual")
         self.traitSelection.addItem("Sound")
+        searchMethodLabel = QLabel()
+        searchMethodLabel.setText("Search Method:")
+        self.searchMethod = QComboBox()
+        self.searchMethod.addItem('Exhaustive')
+        self.searchMethod.addItem('Branch and Bound')
+        self.searchMethod.addItem('Parallel')
         self.calculateButton = QPushButton("Calculate")
         self.calculateButton.setDefault(True)
+        self.searchProgress = QProgressBar()
+        self.searchProgress.setRange(0, 1000)
+        self.searchProgress.setValue(0)
+        self.searchProgress.setTextVisible(True)
+        self.searchWorker = None
+        self.exportButton = QPushButton("Export to Excel")
+        self.exportButton.setToolTip("Write the unlocked ingredients into Potionomics.xlsx")
         self.totalMagimins = QLabel()
         self.totalMagimins.setText("Total Magimins: 0")
+        self.searchStats = QLabel()
+        self.searchStats.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
+        statusLayout = QHBoxLayout()
+        statusLayout.addWidget(self.totalMagimins)
+        statusLayout.addWidget(self.searchStats, 1)
+        capLabel = QLabel()
+        capLabel.setText("Brews by Number of Magimins:")
+        self.capTableData = QtGui.QStandardItemModel(0, 3, self)
+        self.capTable = QTableView(showGrid=False, selectionBehavior=QtWidgets.QAbstractItemView.SelectRows)
+        self.capTable.setToolTip("Click a row to use its number of magimins")
+        self.capTable.verticalHeader().hide()
 
         hlay = QGridLayout(self)
-        hlay.addWidget(self.ingredientTable, 0, 0, 10, 1)
+        hlay.addWidget(self.ingredientTable, 0, 0, 14, 1)
         hlay.addWidget(ingredientNumberLabel, 0, 1)
         hlay.addWidget(self.ingredientNumber, 1, 1)
         hlay.addWidget(magiminsNumberLabel, 2, 1)
@@ -478,32 +728,33 @@ class MagiminsCalculator(QtWidgets.QDialog):
         hlay.addWidget(dailyLabel, 6, 1)
         hlay.addWidget(self.dailyIngredientLimit, 7, 1)
         hlay.addWidget(self.traitSelection, 8, 1)
-        hlay.addWidget(self.calculateButton, 9, 1)
-        hlay.addWidget(self.totalMagimins, 0, 2)
-        hlay.addWidget(self.solutionTable, 1, 2, 9, 1)
+        hlay.addWidget(searchMethodLabel, 9, 1)
+        hlay.addWidget(self.searchMethod, 10, 1)
+        hlay.addWidget(self.calculateButton, 11, 1)
+        hlay.addWidget(self.searchProgress, 12, 1)
+        hlay.addWidget(self.exportButton, 13, 1)
+        hlay.addLayout(statusLayout, 0, 2)
+        hlay.addWidget(self.solutionTable, 1, 2, 13, 1)
+        hlay.addWidget(capLabel, 0, 3)
+        hlay.addWidget(self.capTable, 1, 3, 13, 1)
 
     def closeEvent(self, event):
-        excelLoc = './Potionomics.xlsx'
-        data = pd.read_excel(excelLoc, 'Ingredients', skiprows = 0)
-        data = data.replace(np.nan, 0)
-        states = np.zeros((self.ingredientTableData.rowCount(), 1))
-        for i in range(self.ingredientTableData.rowCount()):
-            states[i] = self.ingredientTableData.item(i, 0).checkState()
-        data['Unlocked'] = states
-        data.to_excel(excelLoc, sheet_name = "Ingredients", index = False)
-
+        if self.searchWorker is not None:
+            self.searchWorker.cancel()
+            self.searchWorker.wait()
 
     @QtCore.pyqtSlot(bool)
     def change_state_of_model(self, state):
-        for i in range(self.ingredientTableData.rowCount()):
-            it = self.ingredientTableData.item(i)
-            if it is not None:
-                it.setCheckState(QtCore.Qt.Checked if state else QtCore.Qt.Unchecked)
+        if self.ingredientTableData is not None:
+            self.ingredientTableData.setAllUnlocked(state)
 
 
 if __name__ == "__main__":
-    app = QtWidgets.QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Magimins Calculator")
+    parser.add_argument('--stats-log', help="file to append the timings and counters of every search to, as json lines")
+    args, qtArguments = parser.parse_known_args()
+    app = QtWidgets.QApplication(sys.argv[:1] + qtArguments)
     w = MagiminsCalculator()
     w.show()
-    controller = Controller(model=Model(), view=w)
+    controller = Controller(model=Model(statsLog=args.stats_log), view=w)
     sys.exit(app.exec_())
\ No newline at end of file
@@ -1,5 +1,4 @@
 pip install PyQt5
 pip install numpy
-pip install pandas
-pip install itertools
-pip install sklearn
\ No newline at end of file
+pip install openpyxl
+pip install pytest
\ No newline at end of file
@@ -0,0 +1,227 @@
+"""Local solver service for clients asking for many brews at once, such as a bot answering several players.
+
+python Server.py [--port 8765] [--workers N] [--timeout SECONDS] listens on localhost. A client sends brew
+queries as JSON lines in the format of python -m Solver, and gets one JSON line per query as soon as its search
+is over, with the query's "id", so it can send many queries without waiting for the answers. A query may give
+its own "timeout" in seconds.
+
+Searches run in a pool of worker processes, each with the ingredients of the workbook and the result cache next
+to it. Identical queries with the same timeout asked while one of them is being searched wait for that search
+instead of starting their own. A search still running at its timeout is stopped and answered with the best brew
+found so far and "cancelled": true; a query whose search has not even answered by then, as when every worker is
+busy, gets an "error" instead. A worker that dies, killed or out of memory, fails the searches of its pool with
+an "error", and the pool is replaced for the next queries.
+
+python Server.py --connect sends the JSON lines of its standard input to a running server and prints the answers.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures.process import BrokenProcessPool
+import Solver
+
+HOST = '127.0.0.1'
+PORT = 8765
+TIMEOUT = 60.0
+GRACE_SECONDS = 5.0 # given to a stopped search to send its answer before its query times out
+
+workerData = {}
+
+
+def initWorker(path, cacheDirectory, chunkSize):
+    workerData['ingredients'] = Solver.loadIngredients(path)
+    workerData['cache'] = None if cacheDirectory is None else Solver.ResultCache(cacheDirectory)
+    workerData['chunkSize'] = chunkSize
+
+
+def searchRequest(data, deadline):
+    # Runs in a worker, stopping the search at deadline (a time.time()). The pool is the parallelism of the
+    # server, so the Parallel method is answered by the exhaustive scan in this process, which finds the same brew,
+    # rather than by a pool of its own in each worker.
+    if data.get('searchMethod') == 'Parallel':
+        data = dict(data, searchMethod='Exhaustive')
+    return Solver.answerRequest(workerData['ingredients'], data, 1, workerData['chunkSize'], workerData['cache'], lambda _: time.time() > deadline)
+
+
+def requestKey(data):
+    # Queries with the same key get the same answer whatever their id
+    data = {field: value for field, value in data.items() if field != 'id'}
+    unlocked = data.get('unlocked')
+    if isinstance(unlocked, list) and all(isinstance(name, str) for name in unlocked):
+        data['unlocked'] = sorted(set(unlocked))
+    return json.dumps(data, sort_keys=True)
+
+
+class SolverServer:
+    # Answers the queries of every client with one pool of processes, replaced when a worker dies. inFlight
+    # holds the search of each query key and the pool running it until it is over.
+    def __init__(self, path='./Potionomics.xlsx', workers=None, timeout=TIMEOUT, cacheDirectory=None, chunkSize=Solver.CHUNK_SIZE):
+        # Built here once, so the workers only read the ingredient cache
+        Solver.loadIngredients(path)
+        self.timeout = timeout
+        self.workers = workers
+        self.workerArguments = (path, cacheDirectory, chunkSize)
+        self.pool = self.makePool()
+        self.inFlight = {}
+        self.searches = 0
+        self.merged = 0 # queries answered by the search of an identical one
+        self.timedOut = 0
+        self.restarts = 0 # pools replaced after a worker died
+
+    def makePool(self):
+        # Workers are started on demand, so they are spawned rather than forked: a forked worker would keep the
+        # connections open at the time, and closing them would not reach the clients
+        return concurrent.futures.ProcessPoolExecutor(self.workers, multiprocessing.get_context('spawn'), initWorker, self.workerArguments)
+
+    def restart(self, pool):
+        # A worker of pool died, which leaves it unusable: it is replaced, unless that was done already, and the
+        # searches it was running are forgotten so that new queries search again
+        if pool is not self.pool:
+            return
+        pool.shutdown(wait=False, cancel_futures=True)
+        self.pool = self.makePool()
+        self.inFlight = {key: entry for key, entry in self.inFlight.items() if entry[1] is not pool}
+        self.restarts += 1
+
+    def submit(self, data, deadline):
+        try:
+            return asyncio.get_running_loop().run_in_executor(self.pool, searchRequest, data, deadline), self.pool
+        except BrokenProcessPool:
+            # The worker died while the pool was idle
+            self.restart(self.pool)
+            return asyncio.get_running_loop().run_in_executor(self.pool, searchRequest, data, deadline), self.pool
+
+    async def answer(self, line):
+        try:
+            data = json.loads(line)
+            if not isinstance(data, dict):
+                raise ValueError("A query must be a JSON object")
+            timeout = float(data.get('timeout', self.timeout))
+        except (ValueError, TypeError) as error:
+            return {'error': str(error)}
+        # Only queries with the same timeout share a search, which then searches as long as each of them asks
+        key = requestKey(dict(data, timeout=timeout))
+        pool = None
+        try:
+            if key in self.inFlight:
+                search, pool = self.inFlight[key]
+                self.merged += 1
+            else:
+                search, pool = self.submit(data, time.time() + timeout)
+                self.inFlight[key] = search, pool
+                search.add_done_callback(lambda done: self.inFlight.pop(key) if self.inFlight.get(key, (None,))[0] is done else None)
+                self.searches += 1
+            # Shielded, so a query timing out leaves the search to the others waiting for it
+            output = dict(await asyncio.wait_for(asyncio.shield(search), timeout + GRACE_SECONDS))
+        except asyncio.TimeoutError:
+            self.timedOut += 1
+            output = {'error': "No answer within " + str(timeout) + "s"}
+        except BrokenProcessPool as error:
+            # A worker died during the search, the next queries are searched by a new pool
+            self.restart(pool)
+            output = {'error': "The search failed: " + repr(error)}
+        except Exception as error:
+            # Such as a worker that could not start
+            output = {'error': "The search failed: " + repr(error)}
+        if 'id' in data:
+            output['id'] = data['id']
+        else:
+            output.pop('id', None)
+        return output
+
+    async def serve(self, reader, writer):
+        # Queries of a client are answered concurrently, in the order their searches end
+        lock = asyncio.Lock()
+        pending = set()
+
+        async def respond(line):
+            output = await self.answer(line)
+            async with lock:
+                writer.write(json.dumps(output).encode('utf-8') + b"\n")
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(respond(line))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        except ConnectionError:
+            pass # the client went away, its searches still end and may serve others
+        finally:
+            writer.close()
+
+    async def start(self, host=HOST, port=PORT):
+        return await asyncio.start_server(self.serve, host, port)
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def connect(lines, host=HOST, port=PORT):
+    # Sends the queries to a running server and yields its answers as they come, one per query
+    reader, writer = await asyncio.open_connection(host, port)
+    count = 0
+    for line in lines:
+        if line.strip():
+            writer.write(line.strip().encode('utf-8') + b"\n")
+            count += 1
+    await writer.drain()
+    try:
+        for _ in range(count):
+            line = await reader.readline()
+            if not line:
+                break
+            yield json.loads(line)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def runClient(host, port):
+    async for output in connect(sys.stdin.readlines(), host, port):
+        print(json.dumps(output), flush=True)
+
+
+async def runServer(options):
+    server = SolverServer(options.data, options.workers, options.timeout, None if options.no_cache else options.cache or Solver.resultsPath(options.data), options.chunk_size)
+    try:
+        listener = await server.start(options.host, options.port)
+        print("Answering brew queries on " + options.host + ":" + str(options.port), file=sys.stderr, flush=True)
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+        print("Searches: " + str(server.searches) + ", merged queries: " + str(server.merged) + ", timed out: " + str(server.timedOut) + ", pools restarted: " + str(server.restarts), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python Server.py', description="Answer brew queries sent as JSON lines over a local connection.")
+    parser.add_argument('--host', default=HOST, help="address to listen on or connect to, only this computer by default")
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--connect', action='store_true', help="send the queries of the standard input to a running server")
+    parser.add_argument('--data', default='./Potionomics.xlsx', help="ingredient workbook")
+    parser.add_argument('--workers', type=int, default=None, help="processes searching at once, all the cores by default")
+    parser.add_argument('--timeout', type=float, default=TIMEOUT, help="seconds a query may search unless it gives its own timeout")
+    parser.add_argument('--chunk-size', type=int, default=Solver.CHUNK_SIZE, help="combinations scored at a time")
+    parser.add_argument('--cache', default=None, help="folder of cached results, next to the workbook by default")
+    parser.add_argument('--no-cache', action='store_true', help="always search")
+    options = parser.parse_args(argv)
+    try:
+        asyncio.run(runClient(options.host, options.port) if options.connect else runServer(options))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
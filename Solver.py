@@ -0,0 +1,1535 @@
+"""Batched scoring engine for the magimins combination search.
+
+Combinations are enumerated in fixed-size chunks and each chunk is scored against a dense
+(n_ingredients, n_magimins) array as soon as it is generated, so memory stays flat whatever the size of the
+search space. The running best is updated exactly like the original loop: a combination replaces the best
+one when it has more magimins, a ratio error no worse than the best one and stays within the magimin cap, so
+chunks must be scored in enumeration order.
+
+searchBranchAndBound gives the same answer without scoring every combination: it builds combinations
+depth-first in the same order and skips a branch when no combination in it could replace the current best.
+searchParallel splits the scan into shards searched by a process pool and merges their frontiers in order.
+
+solve answers a Query about an Ingredients table with any of the three and needs nothing but NumPy, so it can
+be used without the GUI. solveCaps finds the brews of every magimin cap in one scan and solveAll those of every
+potion. python -m Solver reads queries as JSON lines and writes one result per line.
+"""
+import bisect
+import collections
+import contextlib
+import hashlib
+import itertools
+import json
+import math
+import os
+import time
+import numpy as np
+
+CHUNK_SIZE = 65536
+LEAF_SIZE = 4096
+SHARDS_PER_WORKER = 8
+PROGRESS_NODES = 1024
+PROGRESS_SECONDS = 0.1
+
+
+def combinationsTable(n, r):
+    # Every combinations_with_replacement(range(n), r) as rows of an array, in the same (lexicographic) order
+    table = np.zeros((1, 0), dtype=np.intp)
+    for _ in range(r):
+        last = table[:, -1] if table.shape[1] > 0 else np.zeros(table.shape[0], dtype=np.intp)
+        counts = n - last
+        rows = np.repeat(np.arange(table.shape[0]), counts)
+        offsets = np.arange(rows.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+        table = np.column_stack([table[rows], last[rows] + offsets])
+    return table
+
+
+def withinStock(chunk, stock):
+    # Rows are sorted, so the multiplicity of an ingredient is the length of its run
+    run = np.ones(chunk.shape[0], dtype=np.intp)
+    valid = run <= stock[chunk[:, 0]] if chunk.shape[1] > 0 else run > 0
+    for n in range(1, chunk.shape[1]):
+        run = np.where(chunk[:, n] == chunk[:, n - 1], run + 1, 1)
+        valid &= run <= stock[chunk[:, n]]
+    return valid
+
+
+def coversTraits(chunk, cover, required):
+    # cover holds a bitmask of the selected traits each ingredient has
+    covered = np.zeros(chunk.shape[0], dtype=cover.dtype)
+    for n in range(chunk.shape[1]):
+        covered |= cover[chunk[:, n]]
+    return covered == required
+
+
+IMPOSSIBLE = 1 << 30
+
+
+def traitNeeds(cover, required, usable=None):
+    # needs[i][m] is the fewest ingredients from the i-th one onwards that have every trait of the bitmask m
+    # between them, IMPOSSIBLE when they cannot. Ingredients not usable (out of stock) are left out.
+    masks = np.arange(required + 1)
+    needs = np.empty((len(cover) + 1, required + 1), dtype=np.int64)
+    needs[-1] = np.where(masks == 0, 0, IMPOSSIBLE)
+    for i in range(len(cover) - 1, -1, -1):
+        has = int(cover[i]) if usable is None or usable[i] else 0
+        needs[i] = np.minimum(needs[i + 1], needs[i + 1][masks & ~has] + 1)
+    return needs.tolist()
+
+
+def iterCombinationChunks(n, k, chunkSize=CHUNK_SIZE, stock=None, cover=None, required=0, prefix=()):
+    # Stream combinations_with_replacement(range(n), k) in order, chunkSize rows at a time, leaving out the
+    # ones using an ingredient more often than its stock or missing one of the required traits. Rows are built
+    # as a head followed by every suffix from a precomputed table that starts at or after the last ingredient
+    # of the head, so only one table of at most about chunkSize rows is kept in memory. The stock used and the
+    # traits covered are tracked while the head is built, so heads that cannot be completed are never built,
+    # and only the suffixes within the stock that have the traits still missing are used: no combination is
+    # built only to be left out. When prefix is given, only the combinations starting with it are streamed.
+    prefix = tuple(prefix)
+    free = k - len(prefix)
+    if n == 0 and k > 0:
+        return
+    r = 1 if free > 0 else 0
+    while r < free and math.comb(n + r, r + 1) <= chunkSize:
+        r += 1
+    tail = combinationsTable(n, r)
+    capacity = [k] * n if stock is None else [min(int(limit), k) for limit in stock]
+    traits = [0] * n if cover is None else [int(c) for c in cover]
+    if cover is None:
+        required = 0
+    if any(prefix.count(i) > capacity[i] for i in set(prefix)):
+        return
+    covered = 0
+    for i in prefix:
+        covered |= traits[i]
+    run = prefix.count(prefix[-1]) if prefix else 0
+    if stock is None and cover is None:
+        heads = ((prefix + middle, 0, 0) for middle in itertools.combinations_with_replacement(range(prefix[-1] if prefix else 0, n), free - r))
+    else:
+        needs = traitNeeds(traits, required, [c > 0 for c in capacity])
+        available = [0] * (n + 1) # slots that can be filled from the i-th ingredient onwards
+        for i in range(n - 1, -1, -1):
+            available[i] = available[i + 1] + capacity[i]
+
+        def iterHeads(head, length, slots, covered, run):
+            if length == 0:
+                yield head, covered, run
+                return
+            last = head[-1] if head else -1
+            for i in range(max(last, 0), n):
+                used = run if i == last else 0
+                if available[i] - used < slots or needs[i][required & ~covered] > slots:
+                    break # the ingredients after i can do no better
+                if used < capacity[i]:
+                    yield from iterHeads(head + (i,), length - 1, slots - 1, covered | traits[i], used + 1)
+
+        heads = iterHeads(prefix, free - r, free, covered, run)
+    fits = withinStock(tail, np.asarray(capacity)) if stock is not None else np.ones(tail.shape[0], dtype=bool)
+    tailCover = np.zeros(tail.shape[0], dtype=np.int64)
+    for m in range(r):
+        tailCover |= np.asarray(traits, dtype=np.int64)[tail[:, m]]
+    tails = {} # suffixes within the stock having the missing traits, by missing traits
+
+    def suffixes(missing):
+        if missing not in tails:
+            keep = fits & ((tailCover & missing) == missing)
+            rows = tail if keep.all() else tail[keep]
+            starts = np.searchsorted(rows[:, 0], np.arange(n + 1)) if r > 0 else np.zeros(n + 1, dtype=np.intp)
+            lead = (rows == rows[:, :1]).sum(axis=1) # copies of the first ingredient of the row
+            tails[missing] = rows, starts, lead
+        return tails[missing]
+
+    pieces = []
+    size = 0
+    for head, covered, run in heads:
+        rows, starts, lead = suffixes(required & ~covered)
+        if head and stock is not None and r > 0:
+            # The suffixes starting with the last ingredient of the head add to its copies
+            last = head[-1]
+            block = slice(starts[last], starts[last + 1])
+            rows = np.concatenate([rows[block][lead[block] + run <= capacity[last]], rows[starts[last + 1]:]])
+        elif head:
+            rows = rows[starts[head[-1]]:]
+        piece = np.empty((rows.shape[0], k), dtype=np.intp)
+        piece[:, :k - r] = head
+        piece[:, k - r:] = rows
+        pieces.append(piece)
+        size += piece.shape[0]
+        while size >= chunkSize:
+            merged = np.concatenate(pieces)
+            pieces = [merged[chunkSize:]]
+            size -= chunkSize
+            yield merged[:chunkSize]
+    if size > 0:
+        yield np.concatenate(pieces)
+
+
+def iterIncluding(n, k, position, chunkSize=CHUNK_SIZE, stock=None, cover=None, required=0):
+    # The combinations of iterCombinationChunks that include the ingredient at position, as (copies, chunk) with
+    # the number of copies of it. Adding the same copies to combinations keeps their order, so the chunks of
+    # each number of copies come in enumeration order, but the numbers of copies are not interleaved.
+    others = np.flatnonzero(np.arange(n) != position)
+    most = k if stock is None else min(k, int(stock[position]))
+    lacking = 0 if cover is None else required & ~int(cover[position])
+    for copies in range(1, most + 1):
+        if copies == k and lacking:
+            continue
+        for chunk in iterCombinationChunks(len(others), k - copies, chunkSize, None if stock is None else stock[others], None if cover is None else cover[others], lacking):
+            rows = np.concatenate([others[chunk], np.full((chunk.shape[0], copies), position)], axis=1)
+            rows.sort(axis=1)
+            yield copies, rows
+
+
+def scoreTotals(totals, magiminRatio):
+    # Sum of the magimin totals, mean square error of the min-normalised ratio from the ideal one and whether
+    # the combination uses every magimin of the potion
+    valid = (totals != 0).all(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = totals / totals.min(axis=1, keepdims=True)
+        errors = ((np.asarray(magiminRatio) - ratios) ** 2).mean(axis=1)
+    return totals.sum(axis=1), errors, valid
+
+
+def scoreChunk(values, chunk, magiminRatio):
+    totals = np.zeros((chunk.shape[0], values.shape[1]), dtype=values.dtype)
+    for n in range(chunk.shape[1]):
+        totals += values[chunk[:, n]]
+    return scoreTotals(totals, magiminRatio)
+
+
+class BestCombination:
+    def __init__(self, magiminsNumber):
+        self.magiminsNumber = magiminsNumber
+        self.combination = None
+        self.total = 0
+        self.error = 100
+        self.scanned = 0 # combinations scored
+        self.nodes = 0 # partial combinations visited by the branch and bound search
+        self.pruned = 0
+        self.improved = 0 # times the best changed
+        self.cancelled = False
+
+    def update(self, chunk, sums, errors, valid):
+        if self.combination is None and chunk.shape[0] > 0:
+            # Like the original loop, the first combination is reported when none matches
+            self.combination = chunk[0].copy()
+        candidates = np.flatnonzero(valid & (sums <= self.magiminsNumber))
+        while candidates.size > 0:
+            candidates = candidates[(sums[candidates] > self.total) & (errors[candidates] <= self.error)]
+            if candidates.size == 0:
+                break
+            n = candidates[0]
+            self.combination = chunk[n].copy()
+            self.total = int(sums[n])
+            self.error = float(errors[n])
+            self.improved += 1
+            candidates = candidates[1:]
+        self.scanned += chunk.shape[0]
+
+
+def findBestCombination(values, chunks, magiminRatio, magiminsNumber, progress=None):
+    # Score the chunks as they arrive, keeping only the running best. progress is called with the running best
+    # after every chunk and stops the search by returning True.
+    values = np.asarray(values)
+    best = BestCombination(magiminsNumber)
+    for chunk in chunks:
+        best.update(chunk, *scoreChunk(values, chunk, magiminRatio))
+        if progress is not None and progress(best):
+            best.cancelled = True
+            break
+    return best
+
+
+class Frontier:
+    # The combinations of a scan that can still become the running best: for every magimin sum, the ones with a
+    # lower error than every earlier combination with the same sum, in enumeration order. Any other combination
+    # has an earlier one with as many magimins and an error no worse, so it is never accepted whatever the best
+    # was before it. Replaying the frontiers of consecutive parts of the scan one after the other therefore
+    # gives the same best as scanning everything. A combination is only dropped for an earlier one with the same
+    # sum, so the frontier also gives the best under any lower cap.
+    def __init__(self, magiminsNumber):
+        self.magiminsNumber = magiminsNumber
+        self.first = None # first combination of the scan, reported when none matches
+        self.scanned = 0
+        self.cancelled = False
+        self.lowest = np.zeros(0) # lowest error seen for each sum
+        self.parts = []
+
+    def add(self, chunk, sums, errors, valid):
+        if self.first is None and chunk.shape[0] > 0:
+            self.first = chunk[0].copy()
+        self.scanned += chunk.shape[0]
+        keep = np.flatnonzero(valid & (sums <= self.magiminsNumber))
+        if keep.size == 0:
+            return
+        if sums[keep].max() >= self.lowest.shape[0]:
+            self.lowest = np.concatenate([self.lowest, np.full(sums[keep].max() + 1 - self.lowest.shape[0], np.inf)])
+        keep = keep[errors[keep] < self.lowest[sums[keep]]]
+        if keep.size == 0:
+            return
+        # Group by sum in scan order and keep the strict running minima of the error within each group
+        keep = keep[np.lexsort((keep, sums[keep]))]
+        ranks = np.unique(errors[keep], return_inverse=True)[1].ravel()
+        key = sums[keep].astype(np.int64) * (ranks.max() + 2) + (ranks.max() + 1 - ranks)
+        record = key > np.concatenate([[-1], np.maximum.accumulate(key)[:-1]])
+        keep = np.sort(keep[record])
+        np.minimum.at(self.lowest, sums[keep], errors[keep])
+        self.parts.append((chunk[keep], sums[keep], errors[keep]))
+
+    def extend(self, other):
+        # Append the frontier of the part of the scan that comes right after this one
+        if self.first is None:
+            self.first = other.first
+        self.scanned += other.scanned
+        self.parts.extend(other.parts)
+
+    def best(self, magiminsNumber=None):
+        best = BestCombination(self.magiminsNumber if magiminsNumber is None else min(magiminsNumber, self.magiminsNumber))
+        best.combination = self.first
+        for combinations, sums, errors in self.parts:
+            best.update(combinations, sums, errors, np.ones(sums.shape[0], dtype=bool))
+        best.scanned = self.scanned
+        best.cancelled = self.cancelled
+        return best
+
+    def compact(self):
+        # Join the parts into one, in scan order
+        if len(self.parts) > 1:
+            self.parts = [tuple(np.concatenate(arrays) for arrays in zip(*self.parts))]
+
+    def relabel(self, ids):
+        # The same frontier with ingredient n of its combinations renumbered ids[n]
+        self.compact()
+        frontier = Frontier(self.magiminsNumber)
+        frontier.first = None if self.first is None else ids[self.first]
+        frontier.scanned = self.scanned
+        frontier.cancelled = self.cancelled
+        frontier.parts = [(ids[combinations], sums, errors) for combinations, sums, errors in self.parts]
+        return frontier
+
+    def contains(self, ingredient):
+        return any((combinations == ingredient).any() for combinations, _, _ in self.parts)
+
+    def steps(self):
+        # The caps at which the best changes, in increasing order from 0, each with the best from that cap on.
+        # Going from one cap up to the next sum only adds combinations with more magimins than any other, so the
+        # first of them with an error no worse than the running best at its place in the scan becomes the best
+        # and nothing replaces it after: each cap's running best follows from the previous one's.
+        self.compact()
+        found = [(0, self.best(0))]
+        if not self.parts:
+            return found
+        combinations, sums, errors = self.parts[0]
+        order = np.argsort(sums, kind='stable')
+        caps, starts = np.unique(sums[order], return_index=True)
+        positions = [] # places in the scan where the running best is replaced, and the error from there on
+        lowest = []
+        for cap, start, end in zip(caps.tolist(), starts.tolist(), starts[1:].tolist() + [order.shape[0]]):
+            places = order[start:end]
+            before = np.searchsorted(positions, places) - 1
+            current = np.where(before >= 0, np.asarray(lowest + [0.0])[before], 100)
+            accepted = np.flatnonzero(errors[places] <= current)
+            if accepted.size == 0:
+                continue
+            place = int(places[accepted[0]])
+            cut = bisect.bisect_left(positions, place)
+            del positions[cut:], lowest[cut:]
+            positions.append(place)
+            lowest.append(float(errors[place]))
+            best = BestCombination(cap)
+            best.combination = combinations[place].copy()
+            best.total = cap
+            best.error = float(errors[place])
+            best.scanned = self.scanned
+            found.append((cap, best))
+        return found
+
+
+def mergeFrontiers(frontiers):
+    # Frontier of the scan of all the combinations of several disjoint scans, numbered alike: their frontiers
+    # hold every combination of theirs that can be in the merged one, which only has to be rebuilt in scan order
+    merged = Frontier(frontiers[0].magiminsNumber)
+    parts = [part for frontier in frontiers for part in frontier.parts]
+    if parts:
+        combinations, sums, errors = (np.concatenate(arrays) for arrays in zip(*parts))
+        order = np.lexsort(combinations.T[::-1]) if combinations.shape[1] > 0 else np.arange(combinations.shape[0])
+        merged.add(combinations[order], sums[order], errors[order], np.ones(order.shape[0], dtype=bool))
+    merged.first = None
+    merged.scanned = sum(frontier.scanned for frontier in frontiers)
+    return merged
+
+
+# Read-only search data of the worker processes, set once per worker instead of being sent with every shard
+workerData = {}
+
+
+def initWorker(values, stock, cover, cancel):
+    workerData['values'] = values
+    workerData['stock'] = stock
+    workerData['cover'] = cover
+    workerData['cancel'] = cancel
+
+
+def searchShard(prefix, ingredientNumber, magiminRatio, magiminsNumber, required, chunkSize):
+    values = workerData['values']
+    frontier = Frontier(magiminsNumber)
+    for chunk in iterCombinationChunks(values.shape[0], ingredientNumber, chunkSize, workerData['stock'], workerData['cover'], required, prefix):
+        if workerData['cancel'].is_set():
+            break
+        frontier.add(chunk, *scoreChunk(values, chunk, magiminRatio))
+    return frontier
+
+
+def searchParallel(values, magiminRatio, magiminsNumber, ingredientNumber, stock=None, cover=None, required=0, workers=None, chunkSize=CHUNK_SIZE, progress=None):
+    # Split the scan into shards by the first ingredients of the combinations, search them in a process pool and
+    # replay their frontiers in enumeration order, which gives the same answer as the exhaustive scan. progress
+    # is called with the best of the shards merged so far every PROGRESS_SECONDS and stops the search by
+    # returning True.
+    report = None if progress is None else lambda frontier: progress(frontier.best())
+    return scanParallel(values, magiminRatio, magiminsNumber, ingredientNumber, stock, cover, required, workers, chunkSize, report).best()
+
+
+def scanParallel(values, magiminRatio, magiminsNumber, ingredientNumber, stock=None, cover=None, required=0, workers=None, chunkSize=CHUNK_SIZE, progress=None):
+    # Frontier of the whole scan, merged from the frontiers of the shards. progress is called with the frontier
+    # merged so far and stops the search by returning True.
+    # Only imported here, so that the other searches start as quickly as NumPy
+    import concurrent.futures
+    import multiprocessing
+    values = np.asarray(values)
+    n, k = values.shape[0], ingredientNumber
+    workers = workers or os.cpu_count() or 1
+    # Enough shards to keep every worker busy although the first ones are the largest
+    length = 0
+    while n > 0 and length < k and math.comb(n + length - 1, length) < SHARDS_PER_WORKER * workers:
+        length += 1
+    prefixes = list(itertools.combinations_with_replacement(range(n), length))
+    frontier = Frontier(magiminsNumber)
+    cancel = multiprocessing.Event()
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=initWorker, initargs=(values, stock, cover, cancel)) as pool:
+        shards = [pool.submit(searchShard, prefix, k, magiminRatio, magiminsNumber, required, chunkSize) for prefix in prefixes]
+        for shard in shards:
+            # Merge in submission order, checking for cancellation while waiting for the next shard
+            while progress is not None and not shard.done():
+                concurrent.futures.wait([shard], timeout=PROGRESS_SECONDS)
+                if progress(frontier):
+                    # Running shards stop at their next chunk and the queued ones are dropped
+                    cancel.set()
+                    pool.shutdown(cancel_futures=True)
+                    frontier.cancelled = True
+                    return frontier
+            frontier.extend(shard.result())
+    return frontier
+
+
+def countCombinations(n, k, stock=None, cover=None, required=0):
+    # Exact number of combinations the scan scores: those within the stock limit and covering the required
+    # traits. The ways of filling k slots with at most stock[i] copies of each ingredient are counted with a
+    # polynomial product, for each subset of the traits over the ingredients lacking them, and the counts are
+    # combined by inclusion-exclusion.
+    if stock is None and cover is None:
+        return math.comb(n + k - 1, k) if n > 0 else int(k == 0)
+    capacity = [k] * n if stock is None else [min(int(limit), k) for limit in stock]
+    traits = [0] * n if cover is None else [int(c) for c in cover]
+    if cover is None:
+        required = 0
+    total = 0
+    lacking = required
+    while True:
+        ways = [1] + [0] * k
+        for i in range(n):
+            if traits[i] & lacking or capacity[i] == 0:
+                continue
+            # Multiply by 1 + x + ... + x^capacity[i] with a running sum
+            window = 0
+            spread = []
+            for j in range(k + 1):
+                window += ways[j]
+                if j > capacity[i]:
+                    window -= ways[j - capacity[i] - 1]
+                spread.append(window)
+            ways = spread
+        total += -ways[k] if bin(lacking).count('1') % 2 else ways[k]
+        if lacking == 0:
+            return total
+        lacking = (lacking - 1) & required
+
+
+def firstCombination(n, k, stock=None, cover=None, required=0):
+    # First combination in enumeration order that is within the stock limit and covers the required traits,
+    # which is what the original loop reported when no combination matched
+    if cover is None:
+        cover = np.zeros(n, dtype=np.int64)
+        required = 0
+    capacity = np.full(n, k) if stock is None else np.minimum(stock, k)
+    needs = traitNeeds(cover, required, capacity > 0)
+    available = np.zeros(n + 1, dtype=np.int64) # slots that can be filled from the i-th ingredient onwards
+    for i in range(n - 1, -1, -1):
+        available[i] = available[i + 1] + capacity[i]
+
+    def visit(prefix, covered, run):
+        if len(prefix) == k:
+            return prefix if covered == required else None
+        for i in range(prefix[-1] if prefix else 0, n):
+            count = run + 1 if prefix and i == prefix[-1] else 1
+            used = count - 1
+            if needs[i][required & ~covered] > k - len(prefix) or available[i] - used < k - len(prefix):
+                break
+            if count <= capacity[i]:
+                found = visit(prefix + [i], covered | int(cover[i]), count)
+                if found is not None:
+                    return found
+        return None
+
+    return visit([], 0, 0)
+
+
+def reduceCandidates(values, stock, cover, ingredientNumber, magiminsNumber):
+    # Candidates and copies of them that cannot be in the brew the scan picks, so that the search can leave them
+    # out and still give the same brew. The scan only ever replaces its best with a combination within the cap
+    # adding up to more magimins, so leaving out combinations it never accepts changes nothing but the first
+    # combination reported when none matches (see firstCombination). Two kinds are left out:
+    # - copies that put any combination over the cap, even with the fewest magimins in the other slots;
+    # - candidates with the same magimins as an earlier one having all their traits and enough stock for every
+    #   slot. Swapping one for the earlier candidate gives an earlier combination with the same total and error,
+    #   so the scan has already accepted it, or rejected it for a best it can only improve.
+    # Returns which candidates to keep and the stock of the kept ones, None when there is no limit.
+    values = np.asarray(values)
+    n, k = values.shape[0], ingredientNumber
+    keep = np.ones(n, dtype=bool)
+    if n == 0 or k == 0:
+        return keep, stock
+    sums = values.sum(axis=1).astype(np.int64)
+    least = int(sums.min())
+    room = magiminsNumber - k * least
+    limit = np.full(n, k, dtype=np.int64)
+    if room < 0:
+        limit[:] = 0
+    else:
+        more = sums > least
+        limit[more] = np.minimum(room // (sums[more] - least), k)
+    if stock is not None:
+        limit = np.minimum(limit, stock)
+    keep &= limit > 0
+    earlier = {}
+    for i in range(n):
+        row = values[i].tobytes()
+        traits = 0 if cover is None else int(cover[i])
+        for j in earlier.get(row, ()):
+            if traits & ~int(0 if cover is None else cover[j]) == 0 and (stock is None or stock[j] >= k):
+                keep[i] = False
+                break
+        earlier.setdefault(row, []).append(i)
+    limit = limit[keep]
+    return keep, None if stock is None and (limit >= k).all() else limit
+
+
+def searchBranchAndBound(values, magiminRatio, magiminsNumber, ingredientNumber, stock=None, cover=None, required=0, leafSize=LEAF_SIZE, progress=None):
+    # Depth-first search in enumeration order, skipping a branch when its partial magimin total already goes over
+    # the cap once the remaining slots are filled, when the remaining slots cannot bring the total above the
+    # current best, or when the ratio error of every completion is bound to be worse than the current best.
+    # The last few slots are filled from a precomputed table of at most about leafSize rows and scored as one
+    # chunk. The best is only replaced by combinations the exhaustive scan would have accepted at the same
+    # point, so the answer is the same. nodes counts the partial combinations visited and pruned those skipped.
+    # progress is called with the running best every PROGRESS_NODES nodes and stops the search by returning True.
+    values = np.asarray(values)
+    n, k = values.shape[0], ingredientNumber
+    best = BestCombination(magiminsNumber)
+    first = firstCombination(n, k, stock, cover, required)
+    if first is None:
+        return best
+    best.combination = np.array(first, dtype=np.intp)
+    if k == 0:
+        return best
+    ratio = [float(x) for x in magiminRatio]
+    # Smallest and largest magimins (per magimin and in total) of the ingredients from the i-th one onwards
+    suffixMin = np.minimum.accumulate(values[::-1], axis=0)[::-1].tolist()
+    suffixMax = np.maximum.accumulate(values[::-1], axis=0)[::-1].tolist()
+    suffixMinSum = np.minimum.accumulate(values.sum(axis=1)[::-1])[::-1].tolist()
+    suffixMaxSum = np.maximum.accumulate(values.sum(axis=1)[::-1])[::-1].tolist()
+    # Bit s of reachable[i][r] is set when r ingredients from the i-th one onwards can add up to s magimins
+    sums = values.sum(axis=1).tolist()
+    mask = (1 << (max(magiminsNumber, 0) + 1)) - 1
+    reachable = [[1] + [0] * k for _ in range(n + 1)]
+    for i in range(n - 1, -1, -1):
+        for r in range(1, k + 1):
+            reachable[i][r] = (reachable[i + 1][r] | (reachable[i][r - 1] << sums[i])) & mask
+    ingredientValues = values.tolist()
+    limit = (stock if stock is not None else np.full(n, k)).tolist()
+    traitCover = (cover if cover is not None else np.zeros(n, dtype=np.int64)).tolist()
+    needs = traitNeeds(traitCover, required, np.asarray(limit) > 0)
+
+    # Table of the last slots, with the totals, stock and traits of each row
+    r = 1
+    while r < k and math.comb(n + r, r + 1) <= leafSize:
+        r += 1
+    table = combinationsTable(n, r)
+    tableStarts = np.searchsorted(table[:, 0], np.arange(n + 1))
+    tableTotals = values[table].sum(axis=1)
+    tableSums = tableTotals.sum(axis=1)
+    tableFits = withinStock(table, stock) if stock is not None else np.ones(table.shape[0], dtype=bool)
+    tableLead = (table == table[:, :1]).sum(axis=1) # copies of the first ingredient of the row
+    tableCover = np.zeros(table.shape[0], dtype=np.int64)
+    for m in range(r):
+        tableCover |= np.asarray(traitCover, dtype=np.int64)[table[:, m]]
+
+    # An error of at most E keeps every ratio within sqrt(m * E) of its ideal value, so a magimin total can be at
+    # most (ideal + sqrt(m * E)) times any other one. limits holds, for the current best error, the smallest
+    # a_k - c * a_j of the ingredients from the i-th one onwards for every such pair of magimins.
+    limits = {}
+
+    def ratioLimits():
+        if limits.get('error') != best.error:
+            delta = math.sqrt(len(ratio) * best.error * (1 + 1e-9) + 1e-12)
+            limits['error'] = best.error
+            limits['pairs'] = []
+            for a in range(len(ratio)):
+                for b in range(len(ratio)):
+                    if a != b:
+                        c = ratio[a] + delta
+                        lowest = np.minimum.accumulate((values[:, a] - c * values[:, b])[::-1])[::-1].tolist()
+                        limits['pairs'].append((a, b, c, lowest))
+        return limits['pairs']
+
+    def bounded(totals, total, start, remaining):
+        low = max(best.total - total + 1, 0)
+        if magiminsNumber - total < low or (reachable[start][remaining] >> low) & ((1 << (magiminsNumber - total - low + 1)) - 1) == 0:
+            return True # no completion lands between the best total and the cap
+        low = [t + remaining * x for t, x in zip(totals, suffixMin[start])]
+        high = [t + remaining * x for t, x in zip(totals, suffixMax[start])]
+        if min(high) == 0:
+            return True # every completion misses one of the magimins
+        for a, b, c, lowest in ratioLimits():
+            if totals[a] - c * totals[b] + remaining * lowest[start] > 1e-7:
+                return True
+        gap = 0.0
+        for m in range(len(ratio)):
+            lowRatio = max(low[m] / min(high), 1)
+            highRatio = high[m] / min(low) if min(low) > 0 else math.inf
+            if ratio[m] < lowRatio:
+                gap += (lowRatio - ratio[m]) ** 2
+            elif ratio[m] > highRatio:
+                gap += (ratio[m] - highRatio) ** 2
+        # Leave room for rounding so that a combination tying the best error is never skipped
+        return gap / len(ratio) > best.error * (1 + 1e-9) + 1e-12
+
+    def scoreLeaves(prefix, totals, total, run, covered):
+        start = prefix[-1] if prefix else 0
+        rows = slice(tableStarts[start], tableStarts[n])
+        keep = tableFits[rows] & (total + tableSums[rows] <= magiminsNumber) & (total + tableSums[rows] > best.total)
+        if prefix and stock is not None:
+            keep &= (table[rows, 0] != start) | (tableLead[rows] + run <= limit[start])
+        if cover is not None:
+            keep &= (covered | tableCover[rows]) == required
+        keep = np.flatnonzero(keep) + tableStarts[start]
+        chunk = np.empty((keep.shape[0], k), dtype=np.intp)
+        chunk[:, :k - r] = prefix
+        chunk[:, k - r:] = table[keep]
+        best.update(chunk, *scoreTotals(np.asarray(totals) + tableTotals[keep], magiminRatio))
+
+    def visit(prefix, totals, total, run, covered):
+        if best.cancelled:
+            return
+        best.nodes += 1
+        if progress is not None and best.nodes % PROGRESS_NODES == 0 and progress(best):
+            best.cancelled = True
+            return
+        start = prefix[-1] if prefix else 0
+        remaining = k - len(prefix)
+        if bounded(totals, total, start, remaining):
+            best.pruned += 1
+            return
+        if remaining == r:
+            scoreLeaves(prefix, totals, total, run, covered)
+            return
+        for i in range(start, n):
+            if total + remaining * suffixMinSum[i] > magiminsNumber or total + remaining * suffixMaxSum[i] <= best.total:
+                # The smallest completions only grow with i and the largest ones only shrink
+                best.pruned += n - i
+                break
+            if needs[i][required & ~covered] > remaining:
+                best.pruned += n - i
+                break # the remaining slots cannot get the missing traits from i onwards
+            count = run + 1 if prefix and i == prefix[-1] else 1
+            if count <= limit[i]:
+                child = [t + x for t, x in zip(totals, ingredientValues[i])]
+                visit(prefix + [i], child, total + sum(ingredientValues[i]), count, covered | traitCover[i])
+
+    visit([], [0] * values.shape[1], 0, 0, 0)
+    return best
+
+
+MAGIMINS = ['A', 'B', 'C', 'D', 'E', 'F']
+TRAITS = ['Taste', 'Sensation', 'Aroma', 'Visual', 'Sound']
+# Numeric columns of the workbook in the order they are cached
+CACHE_COLUMNS = MAGIMINS + ['Unlocked', 'Stock'] + TRAITS
+SEARCH_METHODS = ['Exhaustive', 'Branch and Bound', 'Parallel']
+# Potion of a query standing for every potion, answered by solveAll
+ALL_POTIONS = 'All Potions'
+# Most ingredients of a brew, far more than any cauldron holds, which keeps the searches recursing once per
+# ingredient within Python's recursion limit
+MAX_INGREDIENTS = 99
+# Largest magimin cap the window offers, the brews of every cap up to it being found by solveCaps
+MAX_MAGIMINS = 2000
+# Magimins of each potion as indices into MAGIMINS, and their ideal ratio
+POTIONS = {
+    'Health Potion': ([0, 1], [1, 1]),
+    'Mana Potion': ([1, 2], [1, 1]),
+    'Stamina Potion': ([0, 4], [1, 1]),
+    'Speed Potion': ([2, 3], [1, 1]),
+    'Tolerance Potion': ([3, 4], [1, 1]),
+    'Fire Tonic': ([0, 2], [1, 1]),
+    'Ice Tonic': ([0, 3], [1, 1]),
+    'Thunder Tonic': ([1, 3], [1, 1]),
+    'Shadow Tonic': ([1, 4], [1, 1]),
+    'Radiation Tonic': ([2, 4], [1, 1]),
+    'Sight Enhancer': ([0, 1, 2], [3, 4, 3]),
+    'Alertness Enhancer': ([1, 2, 3], [3, 4, 3]),
+    'Insight Enhancer': ([0, 1, 4], [4, 3, 4]),
+    'Dowsing Enhancer': ([0, 3, 4], [3, 3, 4]),
+    'Seeking Enhancer': ([2, 3, 4], [3, 4, 3]),
+    'Poison Cure': ([0, 2, 3], [2, 1, 1]),
+    'Drowsiness Cure': ([0, 1, 3], [1, 1, 2]),
+    'Petrification Cure': ([0, 2, 4], [1, 2, 1]),
+    'Silence Cure': ([1, 2, 4], [2, 1, 1]),
+    'Curse Cure': ([1, 2, 4], [1, 1, 1]),
+}
+
+
+class Ingredients:
+    # The ingredient table as plain arrays, one row per ingredient: magimins in MAGIMINS order, daily stock,
+    # traits in TRAITS order (1, 0 or -1) and whether the ingredient is unlocked
+    def __init__(self, names, magimins, stock, traits, unlocked=None):
+        self.names = [str(name) for name in names]
+        self.magimins = np.asarray(magimins, dtype=np.int64).reshape(len(self.names), len(MAGIMINS))
+        self.stock = np.asarray(stock, dtype=np.int64).reshape(len(self.names))
+        self.traits = np.asarray(traits, dtype=np.int64).reshape(len(self.names), len(TRAITS))
+        self.unlocked = np.ones(len(self.names), dtype=bool) if unlocked is None else np.asarray(unlocked, dtype=bool).reshape(len(self.names))
+        self._digest = None
+        self.positions = {name: n for n, name in enumerate(self.names)}
+        # Built once so that a query only has to combine them with the unlocked flags: the candidates of every
+        # potion (some of its magimins and none of the others) and the ingredients with or against every trait
+        self.potionMasks = {}
+        for potion, (magiminUsed, _) in POTIONS.items():
+            others = [n for n in range(len(MAGIMINS)) if n not in magiminUsed]
+            self.potionMasks[potion] = (self.magimins[:, magiminUsed] > 0).any(axis=1) & (self.magimins[:, others] == 0).all(axis=1)
+        self.traitMasks = {trait: self.traits[:, n] > 0 for n, trait in enumerate(TRAITS)}
+        self.negativeTraitMasks = {trait: self.traits[:, n] < 0 for n, trait in enumerate(TRAITS)}
+
+    @classmethod
+    def fromColumns(cls, names, columns):
+        # columns is laid out as CACHE_COLUMNS, the slices stay views when it is memory-mapped
+        return cls(names, columns[:, 0:6], columns[:, 7], columns[:, 8:13], columns[:, 6] == 2)
+
+    def columns(self):
+        return np.column_stack([self.magimins, np.where(self.unlocked, 2, 0), self.stock, self.traits]).astype(np.int64)
+
+    @classmethod
+    def fromRecords(cls, records):
+        # Records are dicts keyed like the columns of the workbook, missing cells counting as 0. Unlocked is a
+        # bool or the check state saved by the GUI (2 when checked).
+        records = list(records)
+        return cls([record['Name'] for record in records],
+                   [[record.get(column) or 0 for column in MAGIMINS] for record in records],
+                   [record.get('Stock') or 0 for record in records],
+                   [[record.get(column) or 0 for column in TRAITS] for record in records],
+                   [record.get('Unlocked') in (True, 2) for record in records])
+
+    def digest(self):
+        # Hash of everything but the unlock state, which queries give on their own
+        if self._digest is None:
+            digest = hashlib.sha256(json.dumps(self.names).encode('utf-8'))
+            for array in (self.magimins, self.stock, self.traits):
+                digest.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+            self._digest = digest.hexdigest()
+        return self._digest
+
+    def unlockedMask(self, unlocked=None):
+        # unlocked is None for the saved states, a collection of names or a flag per ingredient
+        if unlocked is None:
+            return self.unlocked
+        if not isinstance(unlocked, np.ndarray) and all(isinstance(name, str) for name in unlocked):
+            unknown = set(unlocked) - self.positions.keys()
+            if unknown:
+                raise ValueError("Unknown ingredients: " + ", ".join(sorted(unknown)))
+            mask = np.zeros(len(self.names), dtype=bool)
+            mask[[self.positions[name] for name in unlocked]] = True
+            return mask
+        return np.asarray(unlocked, dtype=bool).reshape(len(self.names))
+
+
+def readWorkbook(path, sheetName='Ingredients'):
+    # Only the workbook reader is imported, so the headless path never loads pandas
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook[sheetName].iter_rows(values_only=True)
+        header = [str(cell) for cell in next(rows)]
+        records = [dict(zip(header, row)) for row in rows if row and row[0] is not None]
+    finally:
+        workbook.close()
+    return Ingredients.fromRecords(records)
+
+
+def fileSignature(path):
+    status = os.stat(path)
+    return {'mtime': status.st_mtime_ns, 'size': status.st_size}
+
+
+def fileHash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def writeAtomic(path, write):
+    # write(file) fills a temporary file which then replaces path, so readers never see a partial file
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        write(file)
+    os.replace(temporary, path)
+
+
+def cachePaths(path):
+    # The cache sits next to the workbook: an .npy array of the numeric columns, which is memory-mapped, and a
+    # .json file with the ingredient names and the signature of the workbook it was built from
+    stem = os.path.splitext(path)[0]
+    return stem + '.npy', stem + '.json'
+
+
+def loadIngredients(path, sheetName='Ingredients'):
+    # Ingredients of the workbook with the unlock state saved since, see loadUnlocked
+    ingredients = loadCache(path, sheetName)
+    ingredients.unlocked = loadUnlocked(path, ingredients)
+    return ingredients
+
+
+def loadCache(path, sheetName='Ingredients'):
+    # Ingredients of the workbook, read from the cache unless the workbook changed since it was built. The
+    # modification time and size are checked first and the workbook is only hashed when they differ.
+    arrayPath, indexPath = cachePaths(path)
+    signature = fileSignature(path)
+    try:
+        with open(indexPath, encoding='utf-8') as file:
+            index = json.load(file)
+        if index['sheet'] != sheetName:
+            raise ValueError("Cached another sheet")
+        if index['signature'] != signature:
+            if index['hash'] != fileHash(path):
+                raise ValueError("Workbook changed")
+            # Touched but not changed: keep the cache and remember the new signature
+            index['signature'] = signature
+            writeAtomic(indexPath, lambda file: file.write(json.dumps(index).encode('utf-8')))
+        columns = np.load(arrayPath, mmap_mode='r')
+        if columns.shape != (len(index['names']), len(CACHE_COLUMNS)):
+            raise ValueError("Cache does not match its index")
+    except (OSError, ValueError, KeyError):
+        return buildCache(path, sheetName)
+    return Ingredients.fromColumns(index['names'], columns)
+
+
+def buildCache(path, sheetName='Ingredients'):
+    hashed = fileHash(path)
+    signature = fileSignature(path)
+    ingredients = readWorkbook(path, sheetName)
+    arrayPath, indexPath = cachePaths(path)
+    index = {'sheet': sheetName, 'signature': signature, 'hash': hashed, 'names': ingredients.names}
+    try:
+        # The array goes first: an index left over from an older workbook does not match the new signature
+        writeAtomic(arrayPath, lambda file: np.save(file, ingredients.columns()))
+        writeAtomic(indexPath, lambda file: file.write(json.dumps(index).encode('utf-8')))
+    except OSError:
+        pass # read-only folder, the workbook is read again next time
+    return ingredients
+
+
+def resultsPath(path):
+    # Folder of the ResultCache files next to the workbook
+    return os.path.splitext(path)[0] + '.results'
+
+
+def unlockPath(path):
+    return os.path.splitext(path)[0] + '.unlocked'
+
+
+def loadUnlocked(path, ingredients):
+    # The unlock state is kept apart from the workbook in a log of "+name" (unlocked) and "-name" (locked)
+    # lines replayed over the workbook's Unlocked column. A last line cut short by an interruption is ignored,
+    # and the log is rewritten with one line per ingredient once it gets long.
+    unlocked = ingredients.unlocked.copy()
+    positions = ingredients.positions
+    try:
+        with open(unlockPath(path), encoding='utf-8', newline='\n') as file:
+            lines = file.readlines()
+    except OSError:
+        return unlocked
+    for line in lines:
+        if line.endswith('\n') and line[:1] in '+-' and line[1:-1] in positions:
+            unlocked[positions[line[1:-1]]] = line[0] == '+'
+    if len(lines) > 2 * len(ingredients.names):
+        saveUnlocked(path, ingredients.names, unlocked)
+    return unlocked
+
+
+def recordUnlocked(path, names, unlocked):
+    # Append the new state of the ingredients to the log
+    try:
+        with open(unlockPath(path), 'a', encoding='utf-8', newline='\n') as file:
+            file.write(''.join(('+' if unlocked else '-') + name + '\n' for name in names))
+    except OSError:
+        pass # read-only folder, the state is only kept until the window is closed
+
+
+def saveUnlocked(path, names, unlocked):
+    lines = ''.join(('+' if state else '-') + name + '\n' for name, state in zip(names, unlocked))
+    try:
+        writeAtomic(unlockPath(path), lambda file: file.write(lines.encode('utf-8')))
+    except OSError:
+        pass
+
+
+def exportUnlocked(path, names, unlocked, sheetName='Ingredients'):
+    # Write the unlock state into the workbook's Unlocked column (2 when unlocked, like the GUI check state),
+    # leaving the rest of the workbook as it is
+    import openpyxl
+    workbook = openpyxl.load_workbook(path)
+    sheet = workbook[sheetName]
+    header = [cell.value for cell in sheet[1]]
+    nameColumn, unlockedColumn = header.index('Name') + 1, header.index('Unlocked') + 1
+    states = dict(zip(names, unlocked))
+    for row in range(2, sheet.max_row + 1):
+        name = sheet.cell(row, nameColumn).value
+        if name is not None and str(name) in states:
+            sheet.cell(row, unlockedColumn).value = 2 if states[str(name)] else 0
+    writeAtomic(path, workbook.save)
+
+
+class Query:
+    def __init__(self, potion, ingredientNumber, magiminsNumber, dailyLimit=True, traits=(), unlocked=None, searchMethod='Exhaustive'):
+        if potion not in POTIONS:
+            raise ValueError("Unknown potion: " + str(potion))
+        if searchMethod not in SEARCH_METHODS:
+            raise ValueError("Unknown search method: " + str(searchMethod))
+        for trait in traits:
+            if trait not in TRAITS:
+                raise ValueError("Unknown trait: " + str(trait))
+        if not 0 <= int(ingredientNumber) <= MAX_INGREDIENTS:
+            raise ValueError("ingredientNumber must be from 0 to " + str(MAX_INGREDIENTS))
+        self.potion = potion
+        self.ingredientNumber = int(ingredientNumber)
+        self.magiminsNumber = int(magiminsNumber)
+        self.dailyLimit = bool(dailyLimit)
+        self.traits = list(traits)
+        self.unlocked = unlocked # see Ingredients.unlockedMask
+        self.searchMethod = searchMethod
+
+    @classmethod
+    def fromDict(cls, data):
+        return cls(data['potion'], data['ingredientNumber'], data['magiminsNumber'], data.get('dailyLimit', True), data.get('traits', ()), data.get('unlocked'), data.get('searchMethod', 'Exhaustive'))
+
+    def withCap(self, magiminsNumber):
+        return Query(self.potion, self.ingredientNumber, magiminsNumber, self.dailyLimit, self.traits, self.unlocked, self.searchMethod)
+
+
+class Result:
+    # Answer to a query. count is the number of combinations within the stock limit and covering the traits,
+    # scanned the number scored so far (all of them once an exhaustive search is over), nodes and pruned are
+    # only counted by the branch and bound search. removed is the number of candidates left out before the search
+    # (see reduceCandidates), all of whose combinations are left out of count.
+    # cached is set when the result comes from a ResultCache, with the counts of the search that found it.
+    def __init__(self, query, names, total, error, count, scanned=0, nodes=0, pruned=0, cancelled=False, cached=False, removed=0):
+        self.query = query
+        self.names = names
+        self.total = total
+        self.error = error
+        self.count = count
+        self.scanned = scanned
+        self.nodes = nodes
+        self.pruned = pruned
+        self.cancelled = cancelled
+        self.cached = cached
+        self.removed = removed
+
+    def asDict(self):
+        return {'potion': self.query.potion, 'ingredients': self.names, 'totalMagimins': self.total, 'ratioError': self.error,
+                'count': self.count, 'scanned': self.scanned, 'nodes': self.nodes, 'pruned': self.pruned, 'cancelled': self.cancelled, 'cached': self.cached, 'removed': self.removed}
+
+
+class SearchStats:
+    # Seconds spent in each phase of a search and counters of its combinations, filled in by solve, solveCaps
+    # and solveAll when given one. The combinations rejected by the stock or the traits are counted rather
+    # than enumerated, since the enumeration never builds them.
+    def __init__(self):
+        self.phases = collections.OrderedDict()
+        self.counters = collections.OrderedDict()
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def count(self, counter, number):
+        self.counters[counter] = self.counters.get(counter, 0) + int(number)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def timed(self, chunks, producing='enumerate', consuming='score'):
+        # The chunks as they come, the time spent making them added to the producing phase and the time spent
+        # on each of them before asking for the next one to the consuming phase
+        chunks = iter(chunks)
+        while True:
+            started = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                self.add(producing, time.perf_counter() - started)
+                return
+            self.add(producing, time.perf_counter() - started)
+            started = time.perf_counter()
+            try:
+                yield chunk
+            finally:
+                self.add(consuming, time.perf_counter() - started)
+
+    def countRejected(self, candidates, kept, k, stock, cover, required):
+        # Combinations of the candidates, and those left out by reduceCandidates, over the stock limit and
+        # lacking the traits, out of those of the kept candidates
+        everything = countCombinations(candidates, k)
+        inStock = countCombinations(kept, k, stock)
+        self.count('combinations', everything)
+        self.count('leftOut', everything - countCombinations(kept, k))
+        self.count('rejectedByStock', countCombinations(kept, k) - inStock)
+        self.count('rejectedByTraits', inStock - countCombinations(kept, k, stock, cover, required))
+
+    def asDict(self):
+        return {'phases': dict(self.phases), 'counters': dict(self.counters)}
+
+
+class ResultCache:
+    # Results of earlier queries, the most recently used ones in memory and the others in a folder of small json
+    # files whose total size is bounded, the least recently used ones being removed first. Results are keyed by
+    # the candidate ingredients of the query rather than by the whole unlocked set, and by a digest of the
+    # ingredient data, so editing the workbook never returns a stale result. Every search method gives the same
+    # brew, so the search method is not part of the key.
+    def __init__(self, directory=None, capacity=256, diskBytes=4 << 20):
+        self.directory = directory
+        self.capacity = capacity
+        self.diskBytes = diskBytes
+        self.memory = collections.OrderedDict()
+        self.hits = 0
+        self.diskHits = 0 # hits found on disk only, counted in hits as well
+        self.misses = 0
+        self._diskSize = None
+
+    @staticmethod
+    def fingerprint(ingredients, query, chosen, caps=False):
+        # caps keys the brews of every cap up to query.magiminsNumber found by solveCaps
+        traits = sorted(query.traits, key=TRAITS.index)
+        key = [ingredients.digest(), query.potion, query.ingredientNumber, query.magiminsNumber, query.dailyLimit, traits, [int(n) for n in chosen]]
+        if caps:
+            key.append('caps')
+        return hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+        entry = None
+        if self.directory is not None:
+            path = os.path.join(self.directory, key + '.json')
+            try:
+                with open(path, encoding='utf-8') as file:
+                    entry = json.load(file)
+                os.utime(path) # the modification time orders the files for eviction
+            except (OSError, ValueError):
+                entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.diskHits += 1
+        self.remember(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        self.remember(key, entry)
+        if self.directory is None:
+            return
+        data = json.dumps(entry).encode('utf-8')
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if self._diskSize is None:
+                self._diskSize = sum(item.stat().st_size for item in os.scandir(self.directory) if item.name.endswith('.json'))
+            writeAtomic(os.path.join(self.directory, key + '.json'), lambda file: file.write(data))
+            self._diskSize += len(data)
+            if self._diskSize > self.diskBytes:
+                self.evict()
+        except OSError:
+            pass # read-only folder, the results are only kept in memory
+
+    def remember(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+    def evict(self):
+        # Remove the least recently used files until the folder is down to three quarters of its bound
+        items = sorted((item.stat().st_mtime_ns, item.stat().st_size, item.path) for item in os.scandir(self.directory) if item.name.endswith('.json'))
+        self._diskSize = sum(size for _, size, _ in items)
+        for _, size, path in items:
+            if self._diskSize <= self.diskBytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._diskSize -= size
+
+
+def selectIngredients(ingredients, potion, traits=(), unlocked=None):
+    # Indices of the unlocked ingredients having some of the potion's magimins and none of the others, less the
+    # ones with a negative selected trait
+    keep = ingredients.unlockedMask(unlocked) & ingredients.potionMasks[potion]
+    for trait in traits:
+        keep &= ~ingredients.negativeTraitMasks[trait]
+    return np.flatnonzero(keep)
+
+
+def queryArrays(ingredients, query):
+    # Candidate ingredients of the query and what the search functions take: their magimins of the potion, the
+    # ideal ratio, their stock (None without the daily limit), the bitmask of the selected traits each one has
+    # (None without traits) and the bitmask of all the selected traits
+    chosen = selectIngredients(ingredients, query.potion, query.traits, query.unlocked)
+    return (chosen,) + candidateArrays(ingredients, query, chosen)
+
+
+def candidateArrays(ingredients, query, chosen):
+    # The arrays of queryArrays for the given candidates
+    magiminUsed, magiminRatio = POTIONS[query.potion]
+    values = ingredients.magimins[np.ix_(chosen, magiminUsed)]
+    stock = ingredients.stock[chosen] if query.dailyLimit else None
+    if query.traits:
+        # Bit n is set for the ingredients having the n-th selected trait
+        cover = np.zeros(len(chosen), dtype=np.int64)
+        for n, trait in enumerate(query.traits):
+            cover |= ingredients.traitMasks[trait][chosen].astype(np.int64) << n
+    else:
+        cover = None
+    return values, magiminRatio, stock, cover, (1 << len(query.traits)) - 1
+
+
+def reducedArrays(ingredients, query):
+    # queryArrays less the candidates reduceCandidates leaves out: the indices of all the candidates, which of
+    # them are kept, and the arrays of the kept ones
+    chosen, values, magiminRatio, stock, cover, required = queryArrays(ingredients, query)
+    keep, stock = reduceCandidates(values, stock, cover, query.ingredientNumber, query.magiminsNumber)
+    return chosen, keep, values[keep], magiminRatio, stock, None if cover is None else cover[keep], required
+
+
+def firstNames(ingredients, query):
+    # Ingredients of the first combination of all the candidates, reported when no combination matches
+    chosen, _, _, stock, cover, required = queryArrays(ingredients, query)
+    first = firstCombination(len(chosen), query.ingredientNumber, stock, cover, required)
+    return [] if first is None else [ingredients.names[chosen[n]] for n in first]
+
+
+def countQuery(ingredients, query):
+    # Number of combinations an exhaustive search of the query scores, known before starting it
+    chosen, keep, _, _, stock, cover, required = reducedArrays(ingredients, query)
+    return countCombinations(int(keep.sum()), query.ingredientNumber, stock, cover, required)
+
+
+def solve(ingredients, query, progress=None, workers=None, chunkSize=CHUNK_SIZE, cache=None, stats=None):
+    # Best brew for the query. progress is called with the result so far (every chunk, every PROGRESS_NODES
+    # nodes or every PROGRESS_SECONDS depending on the search method) and stops the search by returning True.
+    # The result is looked up in and saved to cache, a ResultCache, unless the search was stopped. stats, a
+    # SearchStats, gets the time of each phase and the counters of the search.
+    stats = SearchStats() if stats is None else stats
+    with stats.phase('prepare'):
+        chosen, keep, values, magiminRatio, stock, cover, required = reducedArrays(ingredients, query)
+        kept = chosen[keep]
+        removed = len(chosen) - len(kept)
+        count = countCombinations(len(kept), query.ingredientNumber, stock, cover, required)
+        stats.countRejected(len(chosen), len(kept), query.ingredientNumber, stock, cover, required)
+        entry = None
+        if cache is not None:
+            key = ResultCache.fingerprint(ingredients, query, chosen)
+            entry = cache.get(key)
+    if entry is not None:
+        return Result(query, list(entry['names']), entry['total'], entry['error'], count, entry['scanned'], entry['nodes'], entry['pruned'], cached=True, removed=removed)
+    first = []
+
+    def result(best):
+        if best.total == 0:
+            # Nothing matched, so the first combination of all the candidates is reported like the original loop
+            if not first:
+                first.append(firstNames(ingredients, query))
+            names = first[0]
+        else:
+            names = [ingredients.names[kept[n]] for n in best.combination]
+        return Result(query, names, best.total, best.error, count, best.scanned, best.nodes, best.pruned, best.cancelled, removed=removed)
+
+    report = None if progress is None else lambda best: progress(result(best))
+    if query.searchMethod == 'Branch and Bound':
+        with stats.phase('search'):
+            best = searchBranchAndBound(values, magiminRatio, query.magiminsNumber, query.ingredientNumber, stock, cover, required, progress=report)
+        stats.count('nodes', best.nodes)
+        stats.count('pruned', best.pruned)
+    elif query.searchMethod == 'Parallel':
+        with stats.phase('search'):
+            best = searchParallel(values, magiminRatio, query.magiminsNumber, query.ingredientNumber, stock, cover, required, workers, chunkSize, progress=report)
+    else:
+        chunks = iterCombinationChunks(len(kept), query.ingredientNumber, chunkSize, stock, cover, required)
+        best = findBestCombination(values, stats.timed(chunks), magiminRatio, query.magiminsNumber, progress=report)
+    stats.count('scored', best.scanned)
+    stats.count('improved', best.improved)
+    found = result(best)
+    if cache is not None and not found.cancelled:
+        cache.put(key, {'names': found.names, 'total': found.total, 'error': found.error, 'scanned': found.scanned, 'nodes': found.nodes, 'pruned': found.pruned})
+    return found
+
+
+class Brews:
+    # Best brews of a query for every magimin cap up to limit, as the sorted caps at which the brew changes and
+    # the brew from each of them on, so that the brew of any cap is a lookup. Found by solveCaps.
+    def __init__(self, query, limit, caps, brews, count, scanned=0, cancelled=False, cached=False, removed=0, chosen=None, frontier=None):
+        self.query = query
+        self.limit = limit
+        self.caps = caps
+        self.brews = brews # names, total and error from each cap on
+        self.count = count
+        self.scanned = scanned
+        self.cancelled = cancelled
+        self.cached = cached
+        self.removed = removed
+        # Candidates of the query and the frontier of their scan with the ingredients numbered as in the
+        # Ingredients, kept to go on from when other ingredients are unlocked (None for cached brews)
+        self.chosen = chosen
+        self.frontier = frontier
+        self.incremental = False # only the combinations including newly unlocked ingredients were scored
+
+    def result(self, magiminsNumber):
+        if not 0 <= magiminsNumber <= self.limit:
+            raise ValueError("The brews are only known for caps up to " + str(self.limit))
+        names, total, error = self.brews[bisect.bisect_right(self.caps, magiminsNumber) - 1]
+        return Result(self.query.withCap(magiminsNumber), list(names), total, error, self.count, self.scanned, cancelled=self.cancelled, cached=self.cached, removed=self.removed)
+
+    def asDict(self):
+        return {'potion': self.query.potion, 'brews': [{'magiminsNumber': cap, 'ingredients': names, 'totalMagimins': total, 'ratioError': error} for cap, (names, total, error) in zip(self.caps, self.brews)],
+                'count': self.count, 'scanned': self.scanned, 'cancelled': self.cancelled, 'cached': self.cached, 'removed': self.removed}
+
+
+def deltaArrays(ingredients, query, candidates, ingredient):
+    # What iterIncluding takes to enumerate the combinations of the candidates that include ingredient, one of
+    # them: the candidates kept by reduceCandidates, their magimins of the potion, the ideal ratio, stock, traits
+    # and required traits and the position of ingredient among them. None when ingredient is left out.
+    values, magiminRatio, stock, cover, required = candidateArrays(ingredients, query, candidates)
+    keep, stock = reduceCandidates(values, stock, cover, query.ingredientNumber, query.magiminsNumber)
+    if not keep[np.searchsorted(candidates, ingredient)]:
+        return None
+    kept = candidates[keep]
+    return kept, values[keep], magiminRatio, stock, None if cover is None else cover[keep], required, int(np.searchsorted(kept, ingredient))
+
+
+def capsDelta(ingredients, query, previous):
+    # How solveCaps can go on from previous, the Brews of the same query with other ingredients unlocked, rather
+    # than scan everything: None when it cannot or when that scores more combinations, otherwise the candidates
+    # of the query and, for each newly unlocked ingredient in turn, the candidates so far, the ingredient and
+    # the number of combinations including it to score. A locked ingredient changes nothing unless it is in a
+    # combination of the frontier: every other combination is still beaten by an earlier one of the frontier.
+    limit = max(MAX_MAGIMINS, query.magiminsNumber)
+    if previous is None or previous.frontier is None or previous.limit != limit:
+        return None
+    last = previous.query
+    if (query.potion, query.ingredientNumber, query.dailyLimit, sorted(query.traits)) != (last.potion, last.ingredientNumber, last.dailyLimit, sorted(last.traits)):
+        return None
+    chosen = selectIngredients(ingredients, query.potion, query.traits, query.unlocked)
+    for ingredient in np.setdiff1d(previous.chosen, chosen):
+        if previous.frontier.contains(ingredient):
+            return None
+    candidates = np.intersect1d(previous.chosen, chosen)
+    steps = []
+    for ingredient in np.setdiff1d(chosen, previous.chosen):
+        candidates = np.union1d(candidates, [ingredient])
+        arrays = deltaArrays(ingredients, query.withCap(limit), candidates, ingredient)
+        count = 0
+        if arrays is not None:
+            kept, _, _, stock, cover, required, position = arrays
+            others = np.arange(len(kept)) != position
+            count = countCombinations(len(kept), query.ingredientNumber, stock, cover, required) - countCombinations(len(kept) - 1, query.ingredientNumber, None if stock is None else stock[others], None if cover is None else cover[others], required)
+        steps.append((candidates, ingredient, count))
+    if sum(count for _, _, count in steps) > countQuery(ingredients, query.withCap(limit)):
+        return None
+    return chosen, steps
+
+
+def countCaps(ingredients, query, previous=None):
+    # Number of combinations solveCaps scores, going on from previous when it can
+    delta = capsDelta(ingredients, query, previous)
+    if delta is None:
+        return countQuery(ingredients, query.withCap(max(MAX_MAGIMINS, query.magiminsNumber)))
+    return sum(count for _, _, count in delta[1])
+
+
+def solveCaps(ingredients, query, progress=None, workers=None, chunkSize=CHUNK_SIZE, cache=None, previous=None, stats=None):
+    # Best brews of the query for every cap up to MAX_MAGIMINS (or its own cap if higher) from one scan of the
+    # combinations up to that cap, keeping the frontier of those that can become the best (see Frontier).
+    # Branch and bound only searches for one cap, so the scan is parallel with the Parallel method and
+    # exhaustive otherwise. previous is the Brews of the same query with other ingredients unlocked: when
+    # capsDelta allows it, only the combinations including the newly unlocked ingredients are scored and merged
+    # into its frontier. progress is called with the result for the query's cap after every chunk, or every
+    # PROGRESS_SECONDS in parallel, and stops the search by returning True. The brews are looked up in and
+    # saved to cache, a ResultCache, unless the search was stopped. stats is filled in like solve does, with
+    # the combinations up to the highest cap.
+    stats = SearchStats() if stats is None else stats
+    limit = max(MAX_MAGIMINS, query.magiminsNumber)
+    capped = query.withCap(limit)
+    k = query.ingredientNumber
+    with stats.phase('prepare'):
+        chosen, keep, values, magiminRatio, stock, cover, required = reducedArrays(ingredients, capped)
+        kept = chosen[keep]
+        removed = len(chosen) - len(kept)
+        stats.countRejected(len(chosen), len(kept), k, stock, cover, required)
+        delta = capsDelta(ingredients, query, previous)
+        if delta is None:
+            count = countCombinations(len(kept), k, stock, cover, required)
+        else:
+            count = sum(count for _, _, count in delta[1])
+        key = None
+        entry = None
+        if cache is not None:
+            key = ResultCache.fingerprint(ingredients, capped, chosen, caps=True)
+            entry = cache.get(key)
+    if entry is not None:
+        return Brews(query, limit, entry['caps'], entry['brews'], count, entry['scanned'], cached=True, removed=removed, chosen=chosen)
+    first = []
+
+    def brew(best, ids):
+        if best.total == 0:
+            # Nothing matched, so the first combination of all the candidates is reported like solve does
+            if not first:
+                first.append(firstNames(ingredients, query))
+            return first[0], 0, best.error
+        return [ingredients.names[ids[n]] for n in best.combination], best.total, best.error
+
+    def report(frontier, ids, scanned):
+        names, total, error = brew(frontier.best(query.magiminsNumber), ids)
+        return progress(Result(query, names, total, error, count, scanned, removed=removed))
+
+    everyone = np.arange(len(ingredients.names))
+    if delta is not None:
+        frontier = mergeFrontiers([previous.frontier])
+        scanned = 0
+        for candidates, ingredient, _ in delta[1]:
+            arrays = deltaArrays(ingredients, capped, candidates, ingredient)
+            if arrays is None:
+                continue
+            stepKept, stepValues, _, stepStock, stepCover, stepRequired, position = arrays
+            # One frontier per number of copies of the ingredient, each of them enumerated in scan order
+            copies = {}
+            for number, chunk in stats.timed(iterIncluding(len(stepKept), k, position, chunkSize, stepStock, stepCover, stepRequired)):
+                copies.setdefault(number, Frontier(limit)).add(chunk, *scoreChunk(stepValues, chunk, magiminRatio))
+                scanned += chunk.shape[0]
+                if progress is not None and report(frontier, everyone, scanned):
+                    frontier.cancelled = True
+                    break
+            if frontier.cancelled:
+                break
+            frontier = mergeFrontiers([frontier] + [part.relabel(stepKept) for part in copies.values()])
+        frontier.scanned = scanned
+    elif query.searchMethod == 'Parallel':
+        reportMerged = None if progress is None else lambda frontier: report(frontier, kept, frontier.scanned)
+        with stats.phase('search'):
+            frontier = scanParallel(values, magiminRatio, limit, k, stock, cover, required, workers, chunkSize, reportMerged).relabel(kept)
+    else:
+        frontier = Frontier(limit)
+        for chunk in stats.timed(iterCombinationChunks(len(kept), k, chunkSize, stock, cover, required)):
+            frontier.add(chunk, *scoreChunk(values, chunk, magiminRatio))
+            if progress is not None and report(frontier, kept, frontier.scanned):
+                frontier.cancelled = True
+                break
+        frontier = frontier.relabel(kept)
+    with stats.phase('caps'):
+        steps = frontier.steps()
+        brews = Brews(query, limit, [cap for cap, _ in steps], [brew(best, everyone) for _, best in steps], count, frontier.scanned, frontier.cancelled, removed=removed, chosen=chosen, frontier=None if frontier.cancelled else frontier)
+        stats.count('scored', frontier.scanned)
+        stats.count('improved', frontier.best(query.magiminsNumber).improved)
+    brews.incremental = delta is not None
+    if cache is not None and not brews.cancelled:
+        cache.put(key, {'caps': brews.caps, 'brews': brews.brews, 'scanned': brews.scanned})
+    return brews
+
+
+class Plan:
+    # Best brews of several potions found by solveAll. count is the number of combinations it scores, and
+    # scanned the number scored so far.
+    def __init__(self, results, count, scanned=0, cancelled=False):
+        self.results = results
+        self.count = count
+        self.scanned = scanned
+        self.cancelled = cancelled
+        self.cached = all(result is not None and result.cached for result in results)
+
+    def asDict(self):
+        return {'plan': [result.asDict() for result in self.results], 'count': self.count, 'scanned': self.scanned, 'cancelled': self.cancelled, 'cached': self.cached}
+
+
+def planGroups(ingredients, queries):
+    # Indices of the queries, which may only differ by potion, grouped by the magimins of their potion. The
+    # potions of a group have the same candidates and so the same combinations, with the same magimin totals.
+    first = queries[0]
+    unlocked = ingredients.unlockedMask(first.unlocked)
+    for query in queries:
+        if (query.ingredientNumber, query.magiminsNumber, query.dailyLimit, sorted(query.traits)) != (first.ingredientNumber, first.magiminsNumber, first.dailyLimit, sorted(first.traits)) or not np.array_equal(ingredients.unlockedMask(query.unlocked), unlocked):
+            raise ValueError("The potions of a plan must share everything else")
+    groups = {}
+    for n, query in enumerate(queries):
+        groups.setdefault(tuple(POTIONS[query.potion][0]), []).append(n)
+    return list(groups.values())
+
+
+def countPlan(ingredients, queries):
+    return sum(countQuery(ingredients, queries[group[0]]) for group in planGroups(ingredients, queries))
+
+
+def solveAll(ingredients, queries, progress=None, chunkSize=CHUNK_SIZE, cache=None, stats=None):
+    # Best brew of every query, the queries only differing by potion. The combinations of each group of potions
+    # with the same magimins (see planGroups) are scanned once, and the magimin totals of every combination are
+    # scored against the recipe of each potion of the group, so each potion gets the brew solve gives whatever
+    # the search method. Results are looked up in and saved to cache like solve does. progress is called with the
+    # plan so far after every chunk and stops the search by returning True. stats is filled in like solve does,
+    # for all the groups together.
+    stats = SearchStats() if stats is None else stats
+    queries = list(queries)
+    if not queries:
+        return Plan([], 0)
+    results = [None] * len(queries)
+    scans = []
+    with stats.phase('prepare'):
+        for group in planGroups(ingredients, queries):
+            chosen, keep, values, _, stock, cover, required = reducedArrays(ingredients, queries[group[0]])
+            kept = chosen[keep]
+            k = queries[group[0]].ingredientNumber
+            count = countCombinations(len(kept), k, stock, cover, required)
+            pending = []
+            for n in group:
+                key = None
+                if cache is not None:
+                    key = ResultCache.fingerprint(ingredients, queries[n], chosen)
+                    entry = cache.get(key)
+                    if entry is not None:
+                        results[n] = Result(queries[n], list(entry['names']), entry['total'], entry['error'], count, entry['scanned'], entry['nodes'], entry['pruned'], cached=True, removed=len(chosen) - len(kept))
+                        continue
+                pending.append((n, key, BestCombination(queries[n].magiminsNumber)))
+            if pending:
+                stats.countRejected(len(chosen), len(kept), k, stock, cover, required)
+                scans.append((kept, values, stock, cover, required, count, len(chosen) - len(kept), pending))
+    plan = Plan(results, sum(count for _, _, _, _, _, count, _, _ in scans))
+    if not scans:
+        return plan
+    firsts = {}
+
+    def update():
+        for kept, _, _, _, _, count, removed, pending in scans:
+            for n, key, best in pending:
+                if best.total == 0:
+                    # Nothing matched, so the first combination of all the candidates is reported like solve does
+                    if n not in firsts:
+                        firsts[n] = firstNames(ingredients, queries[n])
+                    names = firsts[n]
+                else:
+                    names = [ingredients.names[kept[i]] for i in best.combination]
+                results[n] = Result(queries[n], names, best.total, best.error, count, best.scanned, cancelled=plan.cancelled, removed=removed)
+        plan.cached = False
+        return plan
+
+    for kept, values, stock, cover, required, _, _, pending in scans:
+        k = queries[pending[0][0]].ingredientNumber
+        for chunk in stats.timed(iterCombinationChunks(len(kept), k, chunkSize, stock, cover, required)):
+            totals = np.zeros((chunk.shape[0], values.shape[1]), dtype=values.dtype)
+            for m in range(k):
+                totals += values[chunk[:, m]]
+            for n, _, best in pending:
+                best.update(chunk, *scoreTotals(totals, POTIONS[queries[n].potion][1]))
+            plan.scanned += chunk.shape[0]
+            if progress is not None and progress(update()):
+                plan.cancelled = True
+                break
+        if plan.cancelled:
+            break
+    update()
+    stats.count('scored', plan.scanned)
+    stats.count('improved', sum(best.improved for *_, pending in scans for _, _, best in pending))
+    if cache is not None and not plan.cancelled:
+        for *_, pending in scans:
+            for n, key, _ in pending:
+                found = results[n]
+                cache.put(key, {'names': found.names, 'total': found.total, 'error': found.error, 'scanned': found.scanned, 'nodes': found.nodes, 'pruned': found.pruned})
+    return plan
+
+
+def answerRequest(ingredients, data, workers=None, chunkSize=CHUNK_SIZE, cache=None, progress=None):
+    # Answer to one query of the batch format (see main) as a dict: the brew found by solve, the brews of every
+    # cap found by solveCaps when "caps" is set or the plan of solveAll when the potion is ALL_POTIONS. A bad
+    # query gives a dict with an "error" field instead. An "id" field is copied to the answer either way.
+    # progress is passed on to the search.
+    try:
+        if isinstance(data, dict) and data.get('potion') == ALL_POTIONS:
+            if data.get('caps'):
+                raise ValueError("caps cannot be asked for " + ALL_POTIONS)
+            queries = [Query.fromDict(dict(data, potion=potion)) for potion in POTIONS]
+            output = solveAll(ingredients, queries, progress, chunkSize, cache).asDict()
+        elif isinstance(data, dict) and data.get('caps'):
+            output = solveCaps(ingredients, Query.fromDict(data), progress, workers, chunkSize, cache).asDict()
+        else:
+            output = solve(ingredients, Query.fromDict(data), progress, workers, chunkSize, cache).asDict()
+    except KeyError as error:
+        output = {'error': "Missing field: " + str(error)}
+    except (ValueError, TypeError, AttributeError) as error:
+        output = {'error': str(error)}
+    if isinstance(data, dict) and 'id' in data:
+        output['id'] = data['id']
+    return output
+
+
+def main(argv=None):
+    # python -m Solver [queries.jsonl]: solve one query per line (stdin by default), see Query.fromDict for the
+    # fields, and write one result per line as soon as it is found. An "id" field is copied to the result.
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(prog='python -m Solver', description="Find the best brews for queries read as JSON lines.")
+    parser.add_argument('queries', nargs='?', type=argparse.FileType('r'), default=sys.stdin)
+    parser.add_argument('--data', default='./Potionomics.xlsx', help="ingredient workbook")
+    parser.add_argument('--workers', type=int, default=None, help="processes of the parallel search")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="combinations scored at a time")
+    parser.add_argument('--cache', default=None, help="folder of cached results, next to the workbook by default")
+    parser.add_argument('--no-cache', action='store_true', help="always search")
+    args = parser.parse_args(argv)
+    ingredients = loadIngredients(args.data)
+    cache = None if args.no_cache else ResultCache(args.cache or resultsPath(args.data))
+    failures = 0
+    for number, line in enumerate(args.queries, 1):
+        if not line.strip():
+            continue
+        try:
+            output = answerRequest(ingredients, json.loads(line), args.workers, args.chunk_size, cache)
+        except ValueError as error:
+            output = {'error': str(error)}
+        if 'error' in output:
+            output = dict({'line': number}, **output)
+            failures += 1
+        print(json.dumps(output), flush=True)
+    if cache is not None:
+        print("Result cache: " + str(cache.hits) + " hits (" + str(cache.diskHits) + " from disk), " + str(cache.misses) + " misses", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
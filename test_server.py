@@ -0,0 +1,89 @@
+"""Queries answered by Server.SolverServer over a connection on a free port.
+
+Run with python -m pytest from this folder.
+"""
+import asyncio
+import json
+import os
+import signal
+import pytest
+import Server
+import Solver
+
+EXCEL_LOC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Potionomics.xlsx')
+
+SMALL = {'potion': 'Health Potion', 'ingredientNumber': 3, 'magiminsNumber': 100}
+LARGE = {'potion': 'Health Potion', 'ingredientNumber': 14, 'magiminsNumber': 2000, 'dailyLimit': False, 'unlocked': None}
+
+
+def ask(queries, timeout=Server.TIMEOUT):
+    # Answers of the queries sent on one connection by id, with the server's counts of searches and merged queries
+    async def run():
+        server = Server.SolverServer(EXCEL_LOC, 1, timeout)
+        try:
+            listener = await server.start(Server.HOST, 0)
+            async with listener:
+                port = listener.sockets[0].getsockname()[1]
+                answers = [output async for output in Server.connect([json.dumps(query) for query in queries], Server.HOST, port)]
+        finally:
+            server.close()
+        return {output['id']: output for output in answers}, server.searches, server.merged
+
+    return asyncio.run(run())
+
+
+def test_identical_queries_share_a_search():
+    answers, searches, merged = ask([dict(SMALL, id=1), dict(SMALL, id=2), dict(SMALL, id=3, magiminsNumber=50)])
+    assert (searches, merged) == (2, 1)
+    assert answers[1]['ingredients'] == answers[2]['ingredients']
+    assert not any('error' in output for output in answers.values())
+
+
+def test_queries_with_other_timeouts_are_not_merged():
+    answers, searches, merged = ask([dict(SMALL, id=1, timeout=1), dict(SMALL, id=2, timeout=120)])
+    assert (searches, merged) == (2, 0)
+    assert answers[1]['ingredients'] == answers[2]['ingredients']
+
+
+def test_search_stopped_at_its_timeout():
+    answers, _, _ = ask([dict(LARGE, id=1, timeout=0.5)])
+    assert answers[1]['cancelled'] and answers[1]['scanned'] < answers[1]['count']
+
+
+def test_parallel_gives_the_exhaustive_brew():
+    answers, _, _ = ask([dict(SMALL, id=1, searchMethod='Parallel')])
+    expected = Solver.solve(Solver.loadIngredients(EXCEL_LOC), Solver.Query.fromDict(SMALL))
+    assert (answers[1]['ingredients'], answers[1]['totalMagimins']) == (expected.names, expected.total)
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason="needs SIGKILL")
+def test_killed_worker_is_replaced():
+    async def run():
+        server = Server.SolverServer(EXCEL_LOC, 1)
+        try:
+            listener = await server.start(Server.HOST, 0)
+            async with listener:
+                port = listener.sockets[0].getsockname()[1]
+
+                async def send(query):
+                    return [output async for output in Server.connect([json.dumps(query)], Server.HOST, port)][0]
+
+                answers = [await send(dict(SMALL, id=1))]
+                # Killed while idle, then while searching
+                for pid in list(server.pool._processes):
+                    os.kill(pid, signal.SIGKILL)
+                await asyncio.sleep(0.5)
+                answers.append(await send(dict(SMALL, id=2, magiminsNumber=90)))
+                searching = asyncio.ensure_future(send(dict(LARGE, id=3, timeout=30)))
+                await asyncio.sleep(2)
+                for pid in list(server.pool._processes):
+                    os.kill(pid, signal.SIGKILL)
+                answers.append(await searching)
+                answers.append(await send(dict(SMALL, id=4, magiminsNumber=80)))
+        finally:
+            server.close()
+        return answers, server.restarts
+
+    answers, restarts = asyncio.run(run())
+    assert ['error' in output for output in answers] == [False, False, True, False]
+    assert restarts == 2
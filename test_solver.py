@@ -0,0 +1,272 @@
+"""Equivalence of Solver.solve with the loop the calculator started from, for every search method.
+
+Run with python -m pytest from this folder.
+"""
+import functools
+import itertools
+import json
+import math
+import os
+import shutil
+import time
+import numpy as np
+import pytest
+import Solver
+
+EXCEL_LOC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Potionomics.xlsx')
+
+# Recipes as the original loop had them, magimins numbered by their column in the workbook (A is 1)
+RECIPES = {
+    'Health Potion': ([1, 2], [1, 1]),
+    'Mana Potion': ([2, 3], [1, 1]),
+    'Stamina Potion': ([1, 5], [1, 1]),
+    'Speed Potion': ([3, 4], [1, 1]),
+    'Tolerance Potion': ([4, 5], [1, 1]),
+    'Fire Tonic': ([1, 3], [1, 1]),
+    'Ice Tonic': ([1, 4], [1, 1]),
+    'Thunder Tonic': ([2, 4], [1, 1]),
+    'Shadow Tonic': ([2, 5], [1, 1]),
+    'Radiation Tonic': ([3, 5], [1, 1]),
+    'Sight Enhancer': ([1, 2, 3], [3, 4, 3]),
+    'Alertness Enhancer': ([2, 3, 4], [3, 4, 3]),
+    'Insight Enhancer': ([1, 2, 5], [4, 3, 4]),
+    'Dowsing Enhancer': ([1, 4, 5], [3, 3, 4]),
+    'Seeking Enhancer': ([3, 4, 5], [3, 4, 3]),
+    'Poison Cure': ([1, 3, 4], [2, 1, 1]),
+    'Drowsiness Cure': ([1, 2, 4], [1, 1, 2]),
+    'Petrification Cure': ([1, 3, 5], [1, 2, 1]),
+    'Silence Cure': ([2, 3, 5], [2, 1, 1]),
+    'Curse Cure': ([2, 3, 5], [1, 1, 1]),
+}
+MOST_COMBINATIONS = 3000 # keeps the original loop quick enough
+
+
+def originalBestCombination(ingredients, unlocked, ingredientNumber, magiminsNumber, potionMaking, dailyIngredientLimit, traitSelection):
+    # The loop of the first Model.getBestCombination on the ingredient arrays instead of a DataFrame: names and
+    # total magimins of the brew, or None where it failed for want of any combination
+    magiminUsed, magiminRatio = RECIPES[potionMaking]
+    columns = [m - 1 for m in magiminUsed]
+    others = [m for m in range(len(Solver.MAGIMINS)) if m not in columns]
+    rows = [n for n in range(len(ingredients.names)) if unlocked[n]]
+    rows = [n for n in rows if (ingredients.magimins[n, columns] > 0).any() and (ingredients.magimins[n, others] == 0).all()]
+    if len(traitSelection) > 0:
+        traitColumns = [Solver.TRAITS.index(trait) for trait in traitSelection]
+        rows = [n for n in rows if all(ingredients.traits[n, t] >= 0 for t in traitColumns)]
+        traitIngredients = [set(i for i, n in enumerate(rows) if ingredients.traits[n, t] > 0) for t in traitColumns]
+        commonTraitIngredients = set.intersection(*traitIngredients)
+    combs = []
+    for item in itertools.combinations_with_replacement(range(len(rows)), ingredientNumber):
+        unique = list(set(item))
+        if dailyIngredientLimit == "Yes" and any(item.count(u) > ingredients.stock[rows[u]] for u in unique):
+            continue
+        if len(traitSelection) > 0:
+            if not (any(i in commonTraitIngredients for i in unique) or all(any(i in traits for i in unique) for traits in traitIngredients)):
+                continue
+        combs.append(list(item))
+    result = [0, 0, 100] # combs number, max magimins, mean square error from ideal ratio
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for n in range(len(combs)):
+            lst = [int(sum(ingredients.magimins[rows[i], column] for i in combs[n])) for column in columns]
+            if 0 not in lst:
+                magiminRatioGet = np.array(lst)
+                magiminRatioGet = magiminRatioGet / min(magiminRatioGet)
+                error = ((np.array(magiminRatio) - magiminRatioGet) ** 2).mean()
+                if (sum(lst) > result[1]) and (error <= result[2]) and (sum(lst) <= magiminsNumber):
+                    result = [n, sum(lst), error]
+    if not combs:
+        return None
+    return [ingredients.names[rows[i]] for i in combs[result[0]]], result[1]
+
+
+def randomCases(count, seed=0):
+    # Queries whose original loop stays small: a random part of the potion's candidates unlocked, along with
+    # random other ingredients, which are never used
+    ingredients = Solver.readWorkbook(EXCEL_LOC)
+    rng = np.random.default_rng(seed)
+    cases = []
+    for _ in range(count):
+        potion = str(rng.choice(list(RECIPES)))
+        ingredientNumber = int(rng.integers(1, 6))
+        candidates = np.flatnonzero(ingredients.potionMasks[potion])
+        most = 1
+        while most < len(candidates) and math.comb(most + ingredientNumber, ingredientNumber) <= MOST_COMBINATIONS:
+            most += 1
+        unlocked = rng.random(len(ingredients.names)) < 0.3
+        unlocked[candidates] = False
+        unlocked[rng.choice(candidates, int(rng.integers(1, most + 1)), replace=False)] = True
+        traits = [str(trait) for trait in rng.choice(Solver.TRAITS, int(rng.choice([0, 0, 1, 2])), replace=False)]
+        cases.append((unlocked, ingredientNumber, int(rng.integers(0, 60 * ingredientNumber)), potion, str(rng.choice(["Yes", "No"])), traits))
+    return cases
+
+
+def edgeCases():
+    ingredients = Solver.readWorkbook(EXCEL_LOC)
+    nothing = np.zeros(len(ingredients.names), dtype=bool)
+    health = ingredients.potionMasks['Health Potion'].copy()
+    health[np.flatnonzero(health)[10:]] = False
+    return [(nothing, 3, 100, 'Health Potion', "Yes", []), # no candidate at all
+            (health, 0, 100, 'Health Potion', "No", []), # no ingredient per brew
+            (health, 3, 0, 'Health Potion', "Yes", []), # nothing under the cap, the first combination is reported
+            (health, 4, 1000, 'Health Potion', "Yes", list(Solver.TRAITS)), # every trait
+            (health, 2, 1000, 'Curse Cure', "No", [])] # no candidate of the potion
+
+
+CASES = randomCases(200) + edgeCases()
+
+
+@pytest.fixture(scope='module')
+def ingredients():
+    return Solver.readWorkbook(EXCEL_LOC)
+
+
+@pytest.mark.parametrize('searchMethod', Solver.SEARCH_METHODS)
+@pytest.mark.parametrize('case', range(len(CASES)))
+def test_solve_matches_original_loop(ingredients, case, searchMethod):
+    unlocked, ingredientNumber, magiminsNumber, potion, dailyLimit, traits = CASES[case]
+    original = originalBestCombination(ingredients, unlocked, ingredientNumber, magiminsNumber, potion, dailyLimit, traits)
+    query = Solver.Query(potion, ingredientNumber, magiminsNumber, dailyLimit == "Yes", traits, unlocked, searchMethod)
+    result = Solver.solve(ingredients, query, workers=2)
+    if original is None:
+        assert (result.names, result.total) == ([], 0)
+    else:
+        assert (result.names, result.total) == original
+
+
+def test_negative_ingredient_number_is_rejected():
+    with pytest.raises(ValueError):
+        Solver.Query('Health Potion', -1, 100)
+
+
+def test_too_many_ingredients_is_an_error(ingredients):
+    # Searching so many slots would recurse deeper than Python allows
+    with pytest.raises(ValueError):
+        Solver.Query('Health Potion', Solver.MAX_INGREDIENTS + 1, 100)
+    output = Solver.answerRequest(ingredients, {'potion': 'Health Potion', 'ingredientNumber': 1200, 'magiminsNumber': 100000, 'dailyLimit': False})
+    assert 'error' in output
+
+
+def test_caps_of_all_potions_is_an_error(ingredients):
+    output = Solver.answerRequest(ingredients, {'potion': Solver.ALL_POTIONS, 'caps': True, 'ingredientNumber': 3, 'magiminsNumber': 100, 'id': 1})
+    assert 'error' in output and output['id'] == 1
+
+
+def test_solve_all_counts_like_solve(ingredients):
+    # Each potion of a plan reports the brew and the counts of its own search
+    for ingredientNumber, magiminsNumber in ((2, 20), (4, 50), (3, 200)):
+        queries = [Solver.Query(potion, ingredientNumber, magiminsNumber, True, [], ingredients.unlocked) for potion in Solver.POTIONS]
+        plan = Solver.solveAll(ingredients, queries)
+        for found, query in zip(plan.results, queries):
+            single = Solver.solve(ingredients, query)
+            assert (found.names, found.total, found.count, found.scanned, found.removed) == (single.names, single.total, single.count, single.scanned, single.removed)
+
+
+def test_editing_the_workbook_misses_both_caches(tmp_path):
+    path = str(tmp_path / 'Potionomics.xlsx')
+    shutil.copyfile(EXCEL_LOC, path)
+    query = Solver.Query('Health Potion', 3, 100)
+    cache = Solver.ResultCache(Solver.resultsPath(path))
+    before = Solver.loadIngredients(path)
+    found = Solver.solve(before, query, cache=cache)
+    assert Solver.solve(Solver.loadIngredients(path), query, cache=cache).cached and (cache.hits, cache.misses) == (1, 1)
+    # Touched without a change, the ingredient cache is kept
+    os.utime(path, ns=(time.time_ns() + 10 ** 9,) * 2)
+    assert Solver.loadIngredients(path).digest() == before.digest()
+    import openpyxl
+    workbook = openpyxl.load_workbook(path)
+    sheet = workbook['Ingredients']
+    header = [cell.value for cell in sheet[1]]
+    row = before.positions[found.names[0]] + 2
+    sheet.cell(row, header.index('A') + 1).value += 1
+    workbook.save(path)
+    os.utime(path, ns=(time.time_ns() + 2 * 10 ** 9,) * 2)
+    after = Solver.loadIngredients(path)
+    assert after.digest() != before.digest()
+    assert after.magimins[row - 2, 0] == before.magimins[row - 2, 0] + 1
+    with open(Solver.cachePaths(path)[1], encoding='utf-8') as file:
+        assert json.load(file)['hash'] == Solver.fileHash(path)
+    assert not Solver.solve(after, query, cache=cache).cached and cache.misses == 2
+
+
+def test_result_cache_evicts_the_oldest_files(tmp_path):
+    directory = str(tmp_path / 'results')
+    cache = Solver.ResultCache(directory, capacity=1, diskBytes=1000)
+    entry = {'names': ['Feyberry'] * 8, 'total': 0, 'error': 0.0, 'scanned': 0, 'nodes': 0, 'pruned': 0}
+    keys = ['%064x' % n for n in range(20)]
+    files = 0
+    evictions = 0
+    for key in keys:
+        cache.put(key, entry)
+        sizes = [item.stat().st_size for item in os.scandir(directory)]
+        assert sum(sizes) <= cache.diskBytes
+        if len(sizes) <= files:
+            evictions += 1
+            assert sum(sizes) <= cache.diskBytes * 3 // 4
+        files = len(sizes)
+        time.sleep(0.02) # apart in modification time, which orders the eviction
+    assert evictions > 0
+    # Evicted down to three quarters of the bound, the most recent files being kept
+    kept = sorted(name[:-5] for name in os.listdir(directory))
+    assert kept == keys[-len(kept):] and len(kept) * len(json.dumps(entry)) <= 1000
+    fresh = Solver.ResultCache(directory, diskBytes=1000)
+    assert fresh.get(keys[-1]) == entry and fresh.get(keys[0]) is None
+    assert (fresh.hits, fresh.diskHits, fresh.misses) == (1, 1, 1)
+    assert fresh.get(keys[-1]) == entry and (fresh.hits, fresh.diskHits) == (2, 1)
+
+
+# Every ingredient unlocked, so that the brew changes up to high caps
+CAPS_QUERIES = [('Health Potion', 4, True, [], 'Exhaustive'),
+                ('Sight Enhancer', 3, False, ['Taste'], 'Exhaustive'),
+                ('Fire Tonic', 3, True, ['Aroma', 'Visual'], 'Parallel'),
+                ('Curse Cure', 5, False, [], 'Exhaustive')]
+CAPS = [0, 5, 30, 60, 100, 150, 250, 400, 700, 1200, Solver.MAX_MAGIMINS]
+
+
+@functools.lru_cache(maxsize=None)
+def capsBrews(case):
+    potion, ingredientNumber, dailyLimit, traits, searchMethod = CAPS_QUERIES[case]
+    ingredients = Solver.loadIngredients(EXCEL_LOC)
+    query = Solver.Query(potion, ingredientNumber, 0, dailyLimit, traits, ingredients.names, searchMethod)
+    return Solver.solveCaps(ingredients, query, workers=2)
+
+
+@pytest.mark.parametrize('cap', CAPS)
+@pytest.mark.parametrize('case', range(len(CAPS_QUERIES)))
+def test_brews_of_every_cap_match_solve(case, cap):
+    ingredients = Solver.loadIngredients(EXCEL_LOC)
+    brews = capsBrews(case)
+    found = brews.result(cap)
+    expected = Solver.solve(ingredients, brews.query.withCap(cap))
+    assert (found.names, found.total) == (expected.names, expected.total)
+    if cap == 0:
+        # Nothing matches, so the first combination is reported
+        assert found.total == 0 and found.names == Solver.firstNames(ingredients, brews.query) != []
+
+
+@pytest.mark.parametrize('dailyLimit, traits', [(True, []), (False, ['Taste'])])
+def test_caps_going_on_from_an_earlier_search(dailyLimit, traits):
+    # Unlocking an ingredient only scores the combinations including it, and locking one outside the frontier
+    # scores nothing, but the brews are those of a search from scratch
+    ingredients = Solver.loadIngredients(EXCEL_LOC)
+    everyone = np.ones(len(ingredients.names), dtype=bool)
+
+    def query(unlocked):
+        return Solver.Query('Health Potion', 3, 0, dailyLimit, traits, unlocked)
+
+    def check(before, after, incremental):
+        going = Solver.solveCaps(ingredients, query(after), previous=Solver.solveCaps(ingredients, query(before)))
+        fresh = Solver.solveCaps(ingredients, query(after))
+        assert going.incremental == incremental
+        assert (going.caps, going.brews) == (fresh.caps, fresh.brews)
+
+    full = Solver.solveCaps(ingredients, query(everyone))
+    best = ingredients.positions[full.result(Solver.MAX_MAGIMINS).names[0]]
+    outside = next(n for n in full.chosen if not full.frontier.contains(n))
+    without = everyone.copy()
+    without[best] = False
+    check(without, everyone, True) # unlocked
+    without = everyone.copy()
+    without[outside] = False
+    check(everyone, without, True) # locked, not in the frontier
+    without = everyone.copy()
+    without[best] = False
+    check(everyone, without, False) # locked, in the frontier